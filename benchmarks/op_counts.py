@@ -0,0 +1,74 @@
+"""
+Operation counts of the derivatives of tests/prims.aplf, with and without the
+optimizations applied to derivatives (see src/optimize.py).
+
+Each dfn is differentiated with every optimization turned off, with only
+expression simplification, and with all of them, and the number of primitive
+applications in the resulting APL code is reported for each.
+
+Usage:
+    python -m benchmarks.op_counts [aplparse] [--parser {aplparse,python}]
+"""
+
+
+import argparse
+import re
+
+from src.autodiff import autodiff
+from src.transpile import Aplparse, Pyparse
+from src.transpile.py_to_apl import NAME_TO_GLYPH
+
+
+# Glyphs of primitives, excluding the arguments and the inner product's dot,
+# which would otherwise be confused with decimal points.
+GLYPHS = set(''.join(NAME_TO_GLYPH.values())) - set('⍺⍵.')
+
+CONFIGS = {
+    'none': {'simplify': False, 'dce': False, 'cse': False, 'release': False},
+    'simplify': {'simplify': True, 'dce': False, 'cse': False, 'release': False},
+    'all': {'simplify': True, 'dce': True, 'cse': True},
+}
+
+
+def count_ops(apl: str) -> int:
+    """
+    Counts the primitive applications in APL code, excluding those in strings.
+    """
+    apl = re.sub(r"'[^']*'", '', apl)
+    return sum(char in GLYPHS for char in apl)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Counts the operations in the derivatives \
+                                                  of tests/prims.aplf with and without optimizations.')
+    parser.add_argument('aplparse',
+                        help='Path to aplparse executable, unless the built-in parser is used.',
+                        type=str,
+                        nargs='?')
+    parser.add_argument('--parser',
+                        help='Parse the dfns with aplparse or the built-in Python parser.',
+                        choices=['aplparse', 'python'],
+                        default='aplparse')
+    args = parser.parse_args()
+    if args.parser == 'aplparse' and args.aplparse is None:
+        parser.error('the path to aplparse is required unless --parser python is passed')
+    session_cls = Aplparse if args.parser == 'aplparse' else Pyparse
+
+    with open('tests/prims.aplf', 'r') as f:
+        apls = re.findall(r'\b\w+←\{[^{}]*\}', f.read())
+
+    print(f'{"dfn":>16}' + ''.join(f'{config:>10}' for config in CONFIGS))
+    totals = dict.fromkeys(CONFIGS, 0)
+    with session_cls(args.aplparse) as session:
+        session.parse_many(apls)
+        for apl in apls:
+            counts = {}
+            for config, options in CONFIGS.items():
+                counts[config] = count_ops(autodiff(apl, session, **options))
+                totals[config] += counts[config]
+            print(f'{apl.split("←")[0]:>16}' + ''.join(f'{counts[config]:>10}' for config in CONFIGS))
+    print(f'{"total":>16}' + ''.join(f'{totals[config]:>10}' for config in CONFIGS))
+
+
+if __name__ == '__main__':
+    main()
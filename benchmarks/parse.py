@@ -0,0 +1,60 @@
+"""
+Micro-benchmark of reading aplparse's output and unparsing it into a Python AST.
+
+Synthetic dfns of increasing size are timed, both as a deeply nested chain of
+applications and as a long body of flat statements. The time per node should
+stay roughly constant as the number of nodes grows.
+
+Usage:
+    python -m benchmarks.parse
+"""
+
+
+import timeit
+
+from src.transpile.apl_to_py import Unparse, tree_str_to_tree
+
+
+def nested(n: int) -> str:
+    """
+    Returns the parse tree of a dfn whose body is a chain of n dyadic applications.
+    """
+    tree_str = 'Omega'
+    for i in range(n):
+        tree_str = f'App2(Add[2],Vec[{i},1],{tree_str})'
+    return f'Assign(f,Lam({tree_str}))'
+
+
+def flat(n: int) -> str:
+    """
+    Returns the parse tree of a dfn comprising n statements.
+    """
+    stmts = [f'Assign(x{i},App1(AppOpr1(Slash[1],Add[2]),App2(Sub[2],x,Omega)))' for i in range(n)]
+    return f'Assign(f,Lam({",".join(stmts)},x))'
+
+
+def count(tree_str: str) -> int:
+    """
+    Returns the number of nodes in a parse tree.
+    """
+    n_nodes, stack = 0, [tree_str_to_tree(tree_str)]
+    while stack:
+        node = stack.pop()
+        n_nodes += 1
+        stack.extend(node.children)
+    return n_nodes
+
+
+def main() -> None:
+    print(f'{"shape":>8} {"nodes":>8} {"total (ms)":>12} {"per node (us)":>14}')
+    for shape, gen in [('nested', nested), ('flat', flat)]:
+        for n in [250, 500, 1000, 2000, 4000]:
+            tree_str = gen(n)
+            n_nodes = count(tree_str)
+            secs = min(timeit.repeat(lambda: Unparse.node(tree_str_to_tree(tree_str)),
+                                     number=1, repeat=5))
+            print(f'{shape:>8} {n_nodes:>8} {1e3*secs:>12.2f} {1e6*secs/n_nodes:>14.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Start-up time of the ada command.
+
+The command is timed when it has nothing to differentiate, i.e., for --help
+and for a file of dfns whose derivatives are all cached, which should take
+tens of milliseconds since Tangent is only imported when a derivative is
+actually generated. The slowest imports of the command-line module, as
+reported by python -X importtime, are listed as well.
+
+Usage:
+    python -m benchmarks.startup [runs]
+"""
+
+
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+
+def run(args: List[str], env: Dict[str, str]) -> float:
+    """
+    Runs Python with the given arguments and returns the elapsed time in milliseconds.
+    """
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return 1000 * (time.perf_counter()-start)
+
+
+def import_times(env: Dict[str, str], n: int = 10) -> List[str]:
+    """
+    Returns the n slowest imports of the command-line module, by cumulative time.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import src.cli'],
+                            env=env, check=True, text=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    rows = []
+    for line in result.stderr.splitlines()[1:]:
+        _, cumulative, name = line.split('|')
+        rows.append((int(cumulative), name.strip()))
+    return [f'{name:>40}{cumulative/1000:>10.1f} ms' for cumulative, name in sorted(rows, reverse=True)[:n]]
+
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    scratch = tempfile.mkdtemp(prefix='ada-startup-')
+    env = {**os.environ, 'XDG_CACHE_HOME': scratch}
+    try:
+        apl = os.path.join(scratch, 'prims.aplf')
+        shutil.copy('tests/prims.aplf', apl)
+        cli = ['-m', 'src.cli', apl, '--parser', 'python']
+
+        # The first run fills the cache.
+        run(cli, env)
+        timings = {
+            'ada --help': [run(['-m', 'src.cli', '--help'], env) for _ in range(runs)],
+            'ada (cached)': [run(cli, env) for _ in range(runs)],
+            'python': [run(['-c', 'pass'], env) for _ in range(runs)],
+        }
+        for name, times in timings.items():
+            print(f'{name:>40}{statistics.median(times):>10.1f} ms')
+
+        print('\nSlowest imports of src.cli:')
+        print('\n'.join(import_times(env)))
+
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,4 +3,8 @@ Source-to-source autodiff for APL.
 """
 
 
+__version__ = '0.0.1'
+
+
 from .autodiff import autodiff
+from .cache import DerivativeCache
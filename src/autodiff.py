@@ -4,16 +4,25 @@ Source-to-source autodiff for APL.
 
 
 import ast
-import imp
+import copy
+import hashlib
+import itertools
+import json
+import linecache
 import re
-import sys
+import threading
+import types
 from inspect import getsource
 from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple, Union
 
 import astor
-import tangent
 
-from .transpile import apl_to_py, py_to_apl
+from . import hvp, optimize
+from .batch import lift
+from .checkpoint import rematerialize
+from .profiling import count, stage
+from .transpile import Aplparse, Pyparse, apl_to_py, py_to_apl
 
 
 # Refer to the first comment in autodiff regarding why these aren't declared.
@@ -34,6 +43,7 @@ from .transpile import apl_to_py, py_to_apl
 # w.r.t. the index supplied by the second argument (see also AutodiffTransformer below).
 prims_str = """
 from tangent.grads import adjoint
+from tangent.tangents import tangent_
 
 
 # Functions.
@@ -100,6 +110,20 @@ def JotDiaDyDy(_, __, ___, ____): ...
 def SlashMonMon(_, __): ...
 def SlashbarMonMon(_, __): ...
 
+# Reductions with specialized adjoints (see ReductionTransformer below).
+def SlashMonMonAdd(_): ...
+def SlashMonMonTimes(_): ...
+def SlashMonMonMax(_): ...
+def SlashMonMonMin(_): ...
+def SlashbarMonMonAdd(_): ...
+def SlashbarMonMonTimes(_): ...
+def SlashbarMonMonMax(_): ...
+def SlashbarMonMonMin(_): ...
+
+# Selective assignment as a function, used when gradients are differentiated
+# in turn (see src/hvp.py).
+def SelectiveAssignAt(_, __, ___): ...
+
 
 # Adjoints of differentiable functions.
 @adjoint(AddDy)
@@ -197,8 +221,11 @@ def dDivDy(y, left, right):
 
 @adjoint(DropDy)
 def dDropDy(y, left, right):
-    zeros = TimesDy(0, right)
-    d[right] = SelectiveAssign(DropDy(left, zeros), d[y], zeros)
+    # The derivative is padded with zeros where the elements were dropped,
+    # that is, overtaken from the other end.
+    sign = TakeDy(Nmatch(Rho(right)), Times(left))
+    sign = AddDy(sign, EqDy(sign, 0))
+    d[right] = TakeDy(Sub(TimesDy(sign, Rho(right))), d[y])
 
 
 @adjoint(Enclose)
@@ -286,8 +313,12 @@ def dSubDy(y, left, right):
 
 @adjoint(TakeDy)
 def dTakeDy(y, left, right):
-    zeros = TimesDy(0, right)
-    d[right] = SelectiveAssign(TakeDy(left, zeros), d[y], zeros)
+    # The derivative is padded with zeros where the elements weren't taken,
+    # that is, overtaken to the argument's shape from the same end. Axes that
+    # left doesn't cover, or takes nothing from, count as positive.
+    sign = TakeDy(Nmatch(Rho(right)), Times(left))
+    sign = AddDy(sign, EqDy(sign, 0))
+    d[right] = TakeDy(TimesDy(sign, Rho(right)), d[y])
 
 
 @adjoint(TimesDy)
@@ -355,7 +386,7 @@ def dDotDyDy(y, _, __, left, right):
                     ),
                     right
                 )
-    mat_dy = RhoDy(Cat(dim_left, dim_right), d[y])
+    mat_dy = RhoDy(CatDy(dim_left, dim_right), d[y])
 
     # Computes the derivatives of the matrices, then converts them back
     # into their original shapes.
@@ -383,10 +414,8 @@ def dJotDiaDyMon(y, op_left, op_right, right):
 
 @adjoint(JotDiaDyDy)
 def dJotDiaDyDy(y, op_left, op_right, left, right):
-    # These are the post-broadcasting derivatives.
-    full_dleft = JotDiaDyDy(
-                     TimesDy,
-                     op_right,
+    # These are the post-broadcasting derivatives, which have the shape of the result.
+    full_dleft = TimesDy(
                      d[y],
                      JotDiaDyDy(
                          Autodiff(op_left, 0, True),
@@ -395,9 +424,7 @@ def dJotDiaDyDy(y, op_left, op_right, left, right):
                          right
                      )
                  )
-    full_dright = JotDiaDyDy(
-                      TimesDy,
-                      op_right,
+    full_dright = TimesDy(
                       d[y],
                       JotDiaDyDy(
                           Autodiff(op_left, 1, True),
@@ -417,18 +444,26 @@ def dJotDiaDyDy(y, op_left, op_right, left, right):
                           Nmatch(Rho(full_dright)),
                           Nmatch(Rho(right))
                       )
-    d[left] = Trans(
-                  JotDiaDyMon(
-                      Inline('{+/,⍵}'),
-                      red_rank_dleft,
-                      Trans(full_dleft)
+    # The broadcasted axes are the leading ones, so they're merged into
+    # a single axis by reshaping and then summed in one reduction.
+    d[left] = SlashbarMonMon(
+                  AddDy,
+                  RhoDy(
+                      CatDy(
+                          SlashMonMon(TimesDy, TakeDy(red_rank_dleft, Rho(full_dleft))),
+                          DropDy(red_rank_dleft, Rho(full_dleft))
+                      ),
+                      full_dleft
                   )
               )
-    d[right] = Trans(
-                   JotDiaDyMon(
-                       Inline('{+/,⍵}'),
-                       red_rank_dright,
-                       Trans(full_dright)
+    d[right] = SlashbarMonMon(
+                   AddDy,
+                   RhoDy(
+                       CatDy(
+                           SlashMonMon(TimesDy, TakeDy(red_rank_dright, Rho(full_dright))),
+                           DropDy(red_rank_dright, Rho(full_dright))
+                       ),
+                       full_dright
                    )
                )
 
@@ -524,6 +559,119 @@ def dSlashbarMonMon(y, op, right):
                )
 
 
+# Specialized adjoints of common reductions, which avoid the scans
+# and inlined derivatives of the general ones above.
+@adjoint(SlashMonMonAdd)
+def dSlashMonMonAdd(y, right):
+    # The derivative is broadcast along the last axis.
+    d[right] = JotDiaDyDy(
+                   TimesDy,
+                   1,
+                   RhoDy(
+                       CatDy(Rho(d[y]), 1),
+                       d[y]
+                   ),
+                   RhoDy(TakeDy(-1, Rho(right)), 1)
+               )
+
+
+@adjoint(SlashMonMonTimes)
+def dSlashMonMonTimes(y, right):
+    # The product of the remaining elements is that of the elements before
+    # times that of the elements after, which, unlike dividing the product, is zero-safe.
+    before = JotDiaDyDy(DropDy, 1, -1, CatDy(1, BackslashMonMon(TimesDy, right)))
+    after = Rot(JotDiaDyDy(DropDy, 1, -1, CatDy(1, BackslashMonMon(TimesDy, Rot(right)))))
+    d[right] = JotDiaDyDy(
+                   TimesDy,
+                   1,
+                   RhoDy(
+                       CatDy(Rho(d[y]), 1),
+                       d[y]
+                   ),
+                   TimesDy(before, after)
+               )
+
+
+@adjoint(SlashMonMonMax)
+def dSlashMonMonMax(y, right):
+    # The elements equal to the result split the derivative evenly, which, unlike
+    # giving all of it to the first, needs no scan and thus supports --mode hvp.
+    mask = JotDiaDyDy(
+               EqDy,
+               1,
+               RhoDy(
+                   CatDy(Rho(y), 1),
+                   y
+               ),
+               right
+           )
+    d[right] = JotDiaDyDy(
+                   TimesDy,
+                   1,
+                   RhoDy(
+                       CatDy(Rho(d[y]), 1),
+                       DivDy(d[y], SlashMonMonAdd(mask))
+                   ),
+                   mask
+               )
+
+
+@adjoint(SlashMonMonMin)
+def dSlashMonMonMin(y, right):
+    mask = JotDiaDyDy(
+               EqDy,
+               1,
+               RhoDy(
+                   CatDy(Rho(y), 1),
+                   y
+               ),
+               right
+           )
+    d[right] = JotDiaDyDy(
+                   TimesDy,
+                   1,
+                   RhoDy(
+                       CatDy(Rho(d[y]), 1),
+                       DivDy(d[y], SlashMonMonAdd(mask))
+                   ),
+                   mask
+               )
+
+
+@adjoint(SlashbarMonMonAdd)
+def dSlashbarMonMonAdd(y, right):
+    # Reshaping repeats the derivative along the first axis.
+    d[right] = RhoDy(Rho(right), d[y])
+
+
+@adjoint(SlashbarMonMonTimes)
+def dSlashbarMonMonTimes(y, right):
+    before = DropDy(-1, VcatDy(1, BackslashbarMonMon(TimesDy, right)))
+    after = Vrot(DropDy(-1, VcatDy(1, BackslashbarMonMon(TimesDy, Vrot(right)))))
+    d[right] = TimesDy(
+                   RhoDy(Rho(right), d[y]),
+                   TimesDy(before, after)
+               )
+
+
+@adjoint(SlashbarMonMonMax)
+def dSlashbarMonMonMax(y, right):
+    mask = EqDy(right, RhoDy(Rho(right), y))
+    d[right] = TimesDy(
+                   RhoDy(Rho(right), DivDy(d[y], SlashbarMonMonAdd(mask))),
+                   mask
+               )
+
+
+@adjoint(SlashbarMonMonMin)
+def dSlashbarMonMonMin(y, right):
+    mask = EqDy(right, RhoDy(Rho(right), y))
+    d[right] = TimesDy(
+                   RhoDy(Rho(right), DivDy(d[y], SlashbarMonMonAdd(mask))),
+                   mask
+               )
+
+
 # Adjoins of non-differentiable functions, treated as constants.
 def non_diff_mon(_, right):
     d[right] = TimesDy(0, right)
@@ -539,155 +687,1214 @@ for prim in [Inline, Gradedown, Gradeup, Iota, Match, Max, Min, Nmatch, Rho, Til
 
 for prim in [AndDy, EqDy, GtDy, GteqDy, LtDy, LteqDy, MatchDy, NandDy, NmatchDy, NorDy, OrDy]:
     adjoint(prim)(non_diff_dy)
+
+# Tangents of differentiable functions, used in forward mode.
+@tangent_(AddDy)
+def tAddDy(z, left, right):
+    d[z] = AddDy(d[left], d[right])
+
+
+@tangent_(Cat)
+def tCat(z, right):
+    d[z] = Cat(d[right])
+
+
+@tangent_(CatDy)
+def tCatDy(z, left, right):
+    d[z] = CatDy(d[left], d[right])
+
+
+@tangent_(Circ)
+def tCirc(z, right):
+    d[z] = TimesDy(d[right], Circ(1))
+
+
+@tangent_(CircDy)
+def tCircDy(z, left, right):
+    d[z] = TimesDy(
+               d[right],
+               TimesDy(
+                   Times(SubDy(1.5, left)),
+                   CircDy(
+                       AddDy(Tilde(SubDy(left, 1)), 1),
+                       right
+                   ),
+               ),
+           )
+
+
+@tangent_(Circstar)
+def tCircstar(z, right):
+    d[z] = DivDy(d[right], right)
+
+
+@tangent_(CircstarDy)
+def tCircstarDy(z, left, right):
+    d[z] = AddDy(
+               TimesDy(
+                   d[left],
+                   Sub(
+                       DivDy(
+                           CircstarDy(left, right),
+                           TimesDy(left, Circstar(left))
+                       )
+                   )
+               ),
+               DivDy(
+                   d[right],
+                   TimesDy(Circstar(left), right)
+               )
+           )
+
+
+@tangent_(Disclose)
+def tDisclose(z, right):
+    d[z] = Disclose(d[right])
+
+
+@tangent_(DiscloseDy)
+def tDiscloseDy(z, left, right):
+    d[z] = DiscloseDy(left, d[right])
+
+
+@tangent_(Div)
+def tDiv(z, right):
+    d[z] = TimesDy(
+               d[right],
+               Sub(
+                   Div(TimesDy(right, right))
+               )
+           )
+
+
+@tangent_(DivDy)
+def tDivDy(z, left, right):
+    d[z] = SubDy(
+               DivDy(d[left], right),
+               TimesDy(
+                   d[right],
+                   DivDy(left, TimesDy(right, right))
+               )
+           )
+
+
+@tangent_(DropDy)
+def tDropDy(z, left, right):
+    d[z] = DropDy(left, d[right])
+
+
+@tangent_(Enclose)
+def tEnclose(z, right):
+    d[z] = Enclose(d[right])
+
+
+@tangent_(In)
+def tIn(z, right):
+    d[z] = In(d[right])
+
+
+@tangent_(MaxDy)
+def tMaxDy(z, left, right):
+    d[z] = AddDy(
+               TimesDy(d[left], GteqDy(left, right)),
+               TimesDy(d[right], GteqDy(right, left))
+           )
+
+
+@tangent_(MinDy)
+def tMinDy(z, left, right):
+    d[z] = AddDy(
+               TimesDy(d[left], LteqDy(left, right)),
+               TimesDy(d[right], LteqDy(right, left))
+           )
+
+
+@tangent_(Pipe)
+def tPipe(z, right):
+    d[z] = TimesDy(d[right], Times(right))
+
+
+@tangent_(Pow)
+def tPow(z, right):
+    d[z] = TimesDy(d[right], z)
+
+
+@tangent_(PowDy)
+def tPowDy(z, left, right):
+    d[z] = AddDy(
+               TimesDy(
+                   d[left],
+                   TimesDy(
+                       right,
+                       PowDy(left, SubDy(right, 1))
+                   )
+               ),
+               TimesDy(
+                   d[right],
+                   TimesDy(
+                       Circstar(left),
+                       PowDy(left, right)
+                   )
+               )
+           )
+
+
+@tangent_(RhoDy)
+def tRhoDy(z, left, right):
+    d[z] = RhoDy(left, d[right])
+
+
+@tangent_(Rot)
+def tRot(z, right):
+    d[z] = Rot(d[right])
+
+
+@tangent_(RotDy)
+def tRotDy(z, left, right):
+    d[z] = RotDy(left, d[right])
+
+
+@tangent_(SquadDy)
+def tSquadDy(z, left, right):
+    d[z] = SquadDy(left, d[right])
+
+
+@tangent_(Sub)
+def tSub(z, right):
+    d[z] = Sub(d[right])
+
+
+@tangent_(SubDy)
+def tSubDy(z, left, right):
+    d[z] = SubDy(d[left], d[right])
+
+
+@tangent_(TakeDy)
+def tTakeDy(z, left, right):
+    # Overtaking pads the derivative with zeros too.
+    d[z] = TakeDy(left, d[right])
+
+
+@tangent_(TimesDy)
+def tTimesDy(z, left, right):
+    d[z] = AddDy(
+               TimesDy(d[left], right),
+               TimesDy(left, d[right])
+           )
+
+
+@tangent_(Trans)
+def tTrans(z, right):
+    d[z] = Trans(d[right])
+
+
+@tangent_(TransDy)
+def tTransDy(z, left, right):
+    d[z] = TransDy(left, d[right])
+
+
+@tangent_(Vcat)
+def tVcat(z, right):
+    d[z] = Vcat(d[right])
+
+
+@tangent_(VcatDy)
+def tVcatDy(z, left, right):
+    d[z] = VcatDy(d[left], d[right])
+
+
+@tangent_(Vrot)
+def tVrot(z, right):
+    d[z] = Vrot(d[right])
+
+
+@tangent_(VrotDy)
+def tVrotDy(z, left, right):
+    d[z] = VrotDy(left, d[right])
+
+
+# Tangents of operators.
+@tangent_(DotDyDy)
+def tDotDyDy(z, _, __, left, right):
+    d[z] = AddDy(
+               DotDyDy(AddDy, TimesDy, d[left], right),
+               DotDyDy(AddDy, TimesDy, left, d[right])
+           )
+
+
+@tangent_(JotDiaDyMon)
+def tJotDiaDyMon(z, op_left, op_right, right):
+    d[z] = TimesDy(
+               d[right],
+               JotDiaDyMon(
+                   Autodiff(op_left, 0, False),
+                   op_right,
+                   right
+               )
+           )
+
+
+@tangent_(JotDiaDyDy)
+def tJotDiaDyDy(z, op_left, op_right, left, right):
+    # The derivatives w.r.t. each argument have the shape of the result,
+    # so the arguments' tangents are broadcast to it under the same rank.
+    full_tleft = JotDiaDyDy(AddDy, op_right, d[left], TimesDy(0, right))
+    full_tright = JotDiaDyDy(AddDy, op_right, TimesDy(0, left), d[right])
+    d[z] = AddDy(
+               TimesDy(
+                   full_tleft,
+                   JotDiaDyDy(
+                       Autodiff(op_left, 0, True),
+                       op_right,
+                       left,
+                       right
+                   )
+               ),
+               TimesDy(
+                   full_tright,
+                   JotDiaDyDy(
+                       Autodiff(op_left, 1, True),
+                       op_right,
+                       left,
+                       right
+                   )
+               )
+           )
+
+
+@tangent_(SlashMonMon)
+def tSlashMonMon(z, op, right):
+    # chain times cons is the derivative of the result w.r.t. each element
+    # (see the adjoint of SlashMonMon above).
+    scan = BackslashMonMon(op, right)
+    chain = CatDy(
+                Rot(
+                    BackslashMonMon(
+                        TimesDy,
+                        JotDiaDyDy(
+                            DropDy,
+                            1,
+                            1,
+                            Rot(
+                                Autodiff(op, 0, True)(scan, RotDy(1, right))
+                            )
+                        )
+                    )
+                ),
+                1
+            )
+    cons = CatDy(
+               1,
+               JotDiaDyDy(
+                   DropDy,
+                   1,
+                   1,
+                   Autodiff(op, 1, True)(RotDy(-1, scan), right)
+               )
+           )
+    d[z] = SlashMonMonAdd(TimesDy(d[right], TimesDy(chain, cons)))
+
+
+@tangent_(SlashbarMonMon)
+def tSlashbarMonMon(z, op, right):
+    trans_right = Trans(right)
+    scan = BackslashMonMon(op, trans_right)
+    chain = CatDy(
+                Rot(
+                    BackslashMonMon(
+                        TimesDy,
+                        JotDiaDyDy(
+                            DropDy,
+                            1,
+                            1,
+                            Rot(
+                                Autodiff(op, 0, True)(scan, RotDy(1, trans_right))
+                            )
+                        )
+                    )
+                ),
+                1
+            )
+    cons = CatDy(
+               1,
+               JotDiaDyDy(
+                   DropDy,
+                   1,
+                   1,
+                   Autodiff(op, 1, True)(RotDy(-1, scan), trans_right)
+               )
+           )
+    d[z] = Trans(SlashMonMonAdd(TimesDy(Trans(d[right]), TimesDy(chain, cons))))
+
+
+@tangent_(SlashMonMonAdd)
+def tSlashMonMonAdd(z, right):
+    d[z] = SlashMonMonAdd(d[right])
+
+
+@tangent_(SlashMonMonTimes)
+def tSlashMonMonTimes(z, right):
+    before = JotDiaDyDy(DropDy, 1, -1, CatDy(1, BackslashMonMon(TimesDy, right)))
+    after = Rot(JotDiaDyDy(DropDy, 1, -1, CatDy(1, BackslashMonMon(TimesDy, Rot(right)))))
+    d[z] = SlashMonMonAdd(TimesDy(d[right], TimesDy(before, after)))
+
+
+@tangent_(SlashMonMonMax)
+def tSlashMonMonMax(z, right):
+    # The tangent is the mean of those of the elements equal to the result.
+    mask = JotDiaDyDy(
+               EqDy,
+               1,
+               RhoDy(
+                   CatDy(Rho(z), 1),
+                   z
+               ),
+               right
+           )
+    d[z] = DivDy(SlashMonMonAdd(TimesDy(d[right], mask)), SlashMonMonAdd(mask))
+
+
+@tangent_(SlashMonMonMin)
+def tSlashMonMonMin(z, right):
+    mask = JotDiaDyDy(
+               EqDy,
+               1,
+               RhoDy(
+                   CatDy(Rho(z), 1),
+                   z
+               ),
+               right
+           )
+    d[z] = DivDy(SlashMonMonAdd(TimesDy(d[right], mask)), SlashMonMonAdd(mask))
+
+
+@tangent_(SlashbarMonMonAdd)
+def tSlashbarMonMonAdd(z, right):
+    d[z] = SlashbarMonMonAdd(d[right])
+
+
+@tangent_(SlashbarMonMonTimes)
+def tSlashbarMonMonTimes(z, right):
+    before = DropDy(-1, VcatDy(1, BackslashbarMonMon(TimesDy, right)))
+    after = Vrot(DropDy(-1, VcatDy(1, BackslashbarMonMon(TimesDy, Vrot(right)))))
+    d[z] = SlashbarMonMonAdd(TimesDy(d[right], TimesDy(before, after)))
+
+
+@tangent_(SlashbarMonMonMax)
+def tSlashbarMonMonMax(z, right):
+    # Tangent's optimizations drop the primal if it's read by a single one of
+    # several statements, so the mask is repeated and left to cse instead.
+    d[z] = DivDy(
+               SlashbarMonMonAdd(TimesDy(d[right], EqDy(right, RhoDy(Rho(right), z)))),
+               SlashbarMonMonAdd(EqDy(right, RhoDy(Rho(right), z)))
+           )
+
+
+@tangent_(SlashbarMonMonMin)
+def tSlashbarMonMonMin(z, right):
+    d[z] = DivDy(
+               SlashbarMonMonAdd(TimesDy(d[right], EqDy(right, RhoDy(Rho(right), z)))),
+               SlashbarMonMonAdd(EqDy(right, RhoDy(Rho(right), z)))
+           )
+
+
+# Selective assignment is linear in both the value and the array assigned into.
+@tangent_(SelectiveAssignAt)
+def tSelectiveAssignAt(z, sel, value, base):
+    d[z] = SelectiveAssignAt(sel, d[value], d[base])
+
+
+# Tangents of non-differentiable functions, which are zero.
+def non_diff_tangent_mon(z, _):
+    d[z] = TimesDy(0, z)
+
+
+def non_diff_tangent_dy(z, _, __):
+    d[z] = TimesDy(0, z)
+
+
+for prim in [Inline, Gradedown, Gradeup, Iota, Match, Max, Min, Nmatch, Rho, Tilde, Times]:
+    tangent_(prim)(non_diff_tangent_mon)
+
+for prim in [AndDy, EqDy, GtDy, GteqDy, LtDy, LteqDy, MatchDy, NandDy, NmatchDy, NorDy, OrDy]:
+    tangent_(prim)(non_diff_tangent_dy)
 """
 
 
-def change_dout_name(dpy: str, apl: str, repl: str = '⍺'):
+# Module of primitives and adjoints, built once per process by load_prims.
+_prims: Optional[types.ModuleType] = None
+_prims_lock = threading.Lock()
+
+# Numbers the in-memory source files of transpiled functions.
+_source_ids = itertools.count()
+
+
+def register_source(source: str, filename: str) -> None:
+    """
+    Registers source code with linecache under a pseudo-filename so that
+    inspect.getsource, which Tangent relies on, works for code compiled in memory.
+
+    Args:
+        source: Source code to register.
+        filename: Pseudo-filename the code is compiled under.
+    """
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+
+
+def load_prims() -> types.ModuleType:
+    """
+    Builds the module of primitives and adjoints (see prims_str). This is done
+    once per process, so the adjoints are registered with Tangent only once.
+
+    Returns:
+        Module of primitives and adjoints.
+    """
+    global _prims
+    with _prims_lock:
+        if _prims is None:
+            prims = types.ModuleType('prims')
+            prims.__file__ = '<ada-prims>'
+            register_source(prims_str, prims.__file__)
+            exec(compile(prims_str, prims.__file__, 'exec'), prims.__dict__)
+            _prims = prims
+    return _prims
+
+
+def compile_function(py: str, name: str) -> types.FunctionType:
+    """
+    Compiles a transpiled Python function in memory, in the namespace of
+    the primitives.
+
+    Args:
+        py: Source code of the function.
+        name: Name of the function.
+
+    Returns:
+        Compiled function, whose source is accessible through inspect.getsource
+        until unregister_function is called on it.
+    """
+    filename = f'<ada-{next(_source_ids)}>'
+    register_source(py, filename)
+
+    # Every function gets its own copy of the namespace, so functions
+    # sharing a name never clash.
+    namespace: Dict = dict(load_prims().__dict__)
+    exec(compile(py, filename, 'exec'), namespace)
+    return namespace[name]
+
+
+def unregister_function(func: types.FunctionType) -> None:
+    """
+    Releases the source registered for a function compiled by compile_function.
+    """
+    linecache.cache.pop(func.__code__.co_filename, None)
+
+
+def change_dout_name(dpy: ast.AST, repl: str = '⍺') -> ast.AST:
     """
     Changes the name of the variable representing the output's derivative.
 
     Args:
-        dpy: Derivative of the function as Python source code,
-            used to extract the current name of the output's derivative.
-        apl: APL code for which to change the name of the output's derivatives.
+        dpy: Derivative of the function as a Python module or function definition,
+            whose arguments give the current name of the output's derivative.
         repl: Replacement for the current name of the output's derivative.
 
     Returns:
-        APL code, with the name of the output's derivative changed.
+        The derivative, with the name of the output's derivative changed in place.
+    """
+    func = dpy.body[0] if isinstance(dpy, ast.Module) else dpy
+    args = [arg.arg for arg in func.args.args]
+    dout_name = args[args.index('Omega')+1]
+
+    for node in ast.walk(func):
+        if isinstance(node, ast.Name) and node.id == dout_name:
+            node.id = repl
+        elif isinstance(node, ast.arg) and node.arg == dout_name:
+            node.arg = repl
+    return dpy
+
+
+def check_limitations(py: ast.AST) -> None:
+    """
+    Checks for known limitations of the adjoints.
+
+    Args:
+        py: Transpiled Python function.
+
+    Raises:
+        RuntimeError: The function relies on an unsupported feature.
+    """
+    def name(node: ast.AST) -> str:
+        return node.id if isinstance(node, ast.Name) else ''
+
+    assoc = ('Add', 'And', 'Max', 'Min', 'Or', 'Times')
+    structural = ('Cat', 'Disclose', 'Drop', 'Enclose', 'In', 'Iota', 'Row', 'Squad', 'Trans', 'Vcat')
+    checks = [
+        (lambda func: func == 'CircDy',
+         lambda args: isinstance(args[0], ast.Constant) and args[0].value in (1, 2),
+         'Sin and cos are the only supported trig functions.'),
+        (lambda func: func == 'DotDyDy',
+         lambda args: name(args[0]) == 'Add' and name(args[1]) == 'Times',
+         'The only supported inner product is matrix multiplication.'),
+        (lambda func: func.startswith('JotDia'),
+         lambda args: not isinstance(args[1], ast.Name),
+         'Jot Diaeresis support only extends to rank with scalar right operands.'),
+        (lambda func: func.startswith('JotDia'),
+         lambda args: not name(args[0]).startswith(structural),
+         'Rank does not support structural or selection functions.'),
+        (lambda func: func == 'SlashMonMon',
+         lambda args: name(args[0]).startswith(assoc),
+         'Reduce only works with associative functions.'),
+        (lambda func: func == 'SlashbarMonMon',
+         lambda args: name(args[0]).startswith(assoc),
+         'Reduce first only works with associative functions.'),
+    ]
+
+    calls = [node for node in ast.walk(py)
+             if isinstance(node, ast.Call) and isinstance(node.func, ast.Name)]
+    for applies, valid, msg in checks:
+        for call in calls:
+            if applies(call.func.id) and not valid(call.args):
+                raise RuntimeError(msg)
+
+
+class TangentTransformer(ast.NodeTransformer):
+    """
+    Reformulates Tangent's utilities for initializing, summing, and copying derivatives
+    using their APL equivalents. Additionally, a stack is maintained by Tangent to handle
+    calls to other functions, which isn't supported by the transpiler. Statements relating
+    to it are erased, which is safe since the stack's items are primitives only.
+    """
+    @staticmethod
+    def is_util(node: ast.AST, *names: str) -> bool:
+        return (isinstance(node, ast.Attribute) and
+                isinstance(node.value, ast.Name) and
+                node.value.id == 'tangent' and
+                node.attr.startswith(names))
+
+    @staticmethod
+    def is_stack(stmt: ast.stmt) -> bool:
+        return (any(TangentTransformer.is_util(node, 'Stack', 'push', 'pop')
+                    for node in ast.walk(stmt)) or
+                (isinstance(stmt, ast.Assign) and
+                 isinstance(stmt.value, ast.Constant) and
+                 stmt.value.value is None))
+
+    def visit_FunctionDef(self, node):
+        node.body = [stmt for stmt in node.body if not self.is_stack(stmt)]
+        self.generic_visit(node)
+        return node
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+
+        if self.is_util(node.func, 'init_grad'):
+            return ast.copy_location(ast.Call(func=ast.Name(id='TimesDy', ctx=ast.Load()),
+                                              args=[ast.Constant(0), node.args[0]],
+                                              keywords=[]),
+                                     node)
+
+        if self.is_util(node.func, 'add_grad'):
+            return ast.copy_location(ast.Call(func=ast.Name(id='AddDy', ctx=ast.Load()),
+                                              args=node.args,
+                                              keywords=[]),
+                                     node)
+
+        if self.is_util(node.func, 'copy'):
+            return node.args[0] # APL deep-copies on each assignment.
+
+        return node
+
+
+# Inline dfns evaluating the derivatives of primitives, keyed by the primitive,
+# the index of the argument the derivative is taken w.r.t., and the valence.
+# They're generated at most once per process (see prim_grad).
+_prim_grads: Dict[Tuple[str, int, bool], str] = {}
+
+
+def gen_prim_grad(name: str, idx: int, dyadic: bool) -> str:
+    """
+    Generates the derivative of a primitive as an inline dfn.
+
+    Args:
+        name: Name of the primitive, without a valence suffix.
+        idx: Index of the argument the derivative is taken w.r.t.
+        dyadic: Flag for using the primitive's dyadic version.
+
+    Returns:
+        Inline dfn evaluating the derivative of the primitive.
+    """
+    import tangent
+
+    if dyadic:
+        name += 'Dy'
+    prim = getattr(load_prims(), name)
+
+    # Directly calling a primitive isn't supported by Tangent,
+    # so an identity wrapper is used.
+    def wrapper(Omega):
+        return prim(Omega)
+
+    def wrapperDy(Alpha, Omega):
+        return prim(Alpha, Omega)
+
+    dprim = tangent.grad(wrapperDy if dyadic else wrapper,
+                         wrt=(idx,),
+                         check_dims=False)
+    dprim = ast.parse(getsource(dprim))
+    for node in ast.walk(dprim):
+        if isinstance(node, ast.Name):
+            node.id = node.id.replace('prim', name)
+        elif isinstance(node, ast.arg):
+            node.arg = node.arg.replace('prim', name)
+    dfn = py_to_apl(change_dout_name(dprim, 'out_g'))
+
+    body = re.search(r'\{(.*?)\}', dfn, re.DOTALL).group(1)
+    return ('{out_g←1+0×⍵ ⋄ ' +
+            ' ⋄ '.join([line.strip() for line in body.splitlines()[1:]]) +
+            '}')
+
+
+def prim_grad(name: str, idx: int, dyadic: bool) -> str:
+    """
+    Returns the derivative of a primitive as an inline dfn, generating it
+    only if it hasn't been generated or loaded before (see gen_prim_grad).
+    """
+    key = (name, idx, dyadic)
+    if key not in _prim_grads:
+        with stage('prim_grads'):
+            _prim_grads.setdefault(key, gen_prim_grad(name, idx, dyadic))
+        count('prim_grads_generated')
+    return _prim_grads[key]
+
+
+_scalar_grads: Dict[Tuple[str, int, bool], ast.expr] = {}
+
+
+def scalar_grad(name: str, idx: int, dyadic: bool) -> ast.expr:
+    """
+    Returns the derivative of a scalar primitive as a Python expression of
+    out_g, the output's derivative, and Alpha and Omega, the arguments, by
+    transpiling its inline dfn (see prim_grad) back into Python and substituting
+    every intermediate variable into the returned one.
+    """
+    key = (name, idx, dyadic)
+    if key not in _scalar_grads:
+        with Pyparse() as session:
+            func = apl_to_py('dprim←'+prim_grad(name, idx, dyadic), session).body[0]
+        exprs: Dict[str, ast.expr] = {}
+        for stmt in func.body:
+            value = stmt.value
+            for var, expr in exprs.items():
+                value = optimize.Substitute(var, expr).visit(value)
+            # The output's derivative is left as is, rather than initialized to ones.
+            if isinstance(stmt, ast.Return):
+                _scalar_grads.setdefault(key, value)
+            elif stmt.targets[0].id != 'out_g':
+                exprs[stmt.targets[0].id] = value
+    return copy.deepcopy(_scalar_grads[key])
+
+
+def precompute_prim_grads() -> None:
+    """
+    Generates the derivatives of every primitive w.r.t. each of their arguments,
+    skipping those Tangent can't differentiate.
+    """
+    prims = load_prims()
+    for name, value in vars(prims).items():
+        if (not isinstance(value, types.FunctionType) or
+            not name[0].isupper() or
+            name in ['Inline', 'SelectiveAssign', 'SelectiveAssignAt'] or
+            re.search(r'(Mon|Dy)(Mon|Dy)$', name)):
+            continue
+
+        dyadic = name.endswith('Dy')
+        for idx in range(2 if dyadic else 1):
+            try:
+                prim_grad(name[:-2] if dyadic else name, idx, dyadic)
+
+            except Exception:
+                pass
+
+
+def tangent_version() -> str:
+    """
+    Returns the installed version of Tangent, without importing it.
+    """
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version('tangent')
+
+    except PackageNotFoundError:
+        return 'unknown'
+
+
+# Hash of APLAD's sources, computed once per process (see sources_hash below).
+_sources_hash: Optional[str] = None
+
+
+def sources_hash() -> str:
+    """
+    Returns a hash of APLAD's own Python sources. The version isn't bumped
+    on every change, so this is what tells derivatives generated by different
+    revisions of the transpiler, the optimizations, etc. apart.
+    """
+    global _sources_hash
+    if _sources_hash is None:
+        root = Path(__file__).parent
+        digest = hashlib.sha256()
+        for path in sorted(root.rglob('*.py')):
+            digest.update(path.relative_to(root).as_posix().encode())
+            digest.update(b'\0')
+            digest.update(path.read_bytes())
+            digest.update(b'\0')
+        _sources_hash = digest.hexdigest()
+    return _sources_hash
+
+
+def prims_hash() -> str:
+    """
+    Returns a hash of the primitives and adjoints, APLAD's version and sources,
+    and Tangent's version, identifying what persisted derivatives were generated by.
+    Changes to the transpiler or to Tangent's output thus invalidate them too.
+    """
+    from . import __version__
+
+    digest = hashlib.sha256()
+    for part in [__version__, sources_hash(), tangent_version(), prims_str]:
+        digest.update(part.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def save_prim_grads(path: Union[str, Path]) -> None:
+    """
+    Persists the derivatives of primitives generated so far.
+
+    Args:
+        path: Path of the JSON file the derivatives are saved to.
+    """
+    grads = [[*key, dfn] for key, dfn in sorted(_prim_grads.items())]
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    Path(path).write_text(json.dumps({'prims': prims_hash(), 'grads': grads},
+                                     ensure_ascii=False),
+                          encoding='utf-8')
+
+
+def load_prim_grads(path: Union[str, Path]) -> None:
     """
-    dout_name = re.findall(r'def \w+\((?:Alpha, )?Omega, (\w+)', dpy)[0]
-    return re.sub(rf'(?<!\w){dout_name}(?!\w)', repl, apl)
+    Loads derivatives of primitives persisted by save_prim_grads. They're ignored
+    if they were generated from different adjoint definitions or by a different
+    version of APLAD or Tangent, or if they can't be read.
+
+    Args:
+        path: Path of the JSON file the derivatives are loaded from.
+    """
+    try:
+        data = json.loads(Path(path).read_text(encoding='utf-8'))
+
+    except (OSError, ValueError):
+        return
+
+    if data.get('prims') == prims_hash():
+        for name, idx, dyadic, dfn in data['grads']:
+            _prim_grads.setdefault((name, idx, dyadic), dfn)
 
 
 class AutodiffTransformer(ast.NodeTransformer):
     """
     Inlines the derivatives of primitives used by Autodiff in adjoints (see
     also prims_str).
+
+    The derivatives of scalar functions are themselves scalar functions, so when
+    the operand of rank is a scalar function, its derivative is applied once to
+    the whole arguments rather than once per cell. The adjoints and tangents of
+    rank multiply it by a derivative shaped like the result, which is substituted
+    for the output's derivative in the primitive's derivative (see scalar_grad),
+    e.g., the adjoint of x(+⍤1)y w.r.t. either argument is the output's derivative
+    itself. Only the arguments the derivative refers to are broadcast to the shape
+    of the result, and only if their shape differs from it.
+
+    Args:
+        differentiable: Flag to broadcast arguments with primitives alone,
+            rather than with inlined dfns that skip arguments shaped like the
+            result, so the derivative can be differentiated again (see src/hvp.py).
     """
-    def __init__(self, prims: type) -> None:
-        self.prims = prims
+    # Scalar primitives, whose derivatives are pervasive.
+    SCALAR = {'Add', 'And', 'Circ', 'Circstar', 'Div', 'Eq', 'Gt', 'Gteq', 'Lt', 'Lteq',
+              'Max', 'Min', 'Nand', 'Nor', 'Or', 'Pipe', 'Pow', 'Sub', 'Tilde', 'Times'}
+
+    def __init__(self, differentiable: bool = False):
+        self.differentiable = differentiable
+
+    @staticmethod
+    def call(func: str, *args: ast.AST) -> ast.Call:
+        return ast.Call(func=ast.Name(id=func, ctx=ast.Load()), args=list(args), keywords=[])
+
+    @staticmethod
+    def inline(node: ast.Call) -> ast.Call:
+        # Autodiff's third argument indicates the primitive's dyadic version
+        # is to be used.
+        anon = prim_grad(node.args[0].id, node.args[1].value, node.args[2].value)
+        return AutodiffTransformer.call('Inline', ast.Constant(anon))
+
+    @staticmethod
+    def is_scalar_rank(node: ast.AST) -> bool:
+        return (isinstance(node, ast.Call) and
+                isinstance(node.func, ast.Name) and
+                node.func.id in ('JotDiaDyMon', 'JotDiaDyDy') and
+                isinstance(node.args[0], ast.Call) and
+                isinstance(node.args[0].func, ast.Name) and
+                node.args[0].func.id == 'Autodiff' and
+                isinstance(node.args[0].args[0], ast.Name) and
+                node.args[0].args[0].id in AutodiffTransformer.SCALAR)
+
+    @staticmethod
+    def cell_ranks(rank: ast.AST) -> Optional[Tuple[int, int]]:
+        """
+        Returns the ranks of the left and right cells of a dyadic application of
+        rank, possibly negative, if its right operand is a literal.
+        """
+        if isinstance(rank, ast.Constant) and isinstance(rank.value, int):
+            spec = [rank.value]
+        elif (isinstance(rank, ast.UnaryOp) and isinstance(rank.op, ast.USub) and
+              isinstance(rank.operand, ast.Constant) and isinstance(rank.operand.value, int)):
+            spec = [-rank.operand.value]
+        elif (isinstance(rank, ast.Call) and isinstance(rank.func, ast.Name) and
+              rank.func.id == 'Inline' and re.fullmatch(r'¯?\d+( ¯?\d+){0,2}', rank.args[0].value)):
+            spec = [int(item.replace('¯', '-')) for item in rank.args[0].value.split()]
+        else:
+            return None
+        # A single rank applies to both arguments, and three start with the monadic one.
+        return (spec[0], spec[0]) if len(spec) == 1 else (spec[-2], spec[-1])
+
+    def broadcast(self, node: ast.Call, idx: int, like: Optional[ast.AST]) -> ast.AST:
+        """
+        Broadcasts an argument of a dyadic application of rank to the shape of the result.
+
+        Args:
+            node: Application of rank.
+            idx: Index of the argument among the application's arrays.
+            like: Array shaped like the result, if any.
+
+        Returns:
+            The broadcast argument.
+        """
+        _, rank, left, right = node.args
+        arg = copy.deepcopy(node.args[2+idx])
+        ranks = self.cell_ranks(rank)
+        if like is not None and ranks is not None and not self.differentiable:
+            # The argument is shaped like the result, a cell extended to every
+            # frame, for which reshaping cycles through it, or a frame of scalar
+            # cells, which are extended within their cells through transposes.
+            cell = ranks[idx]
+            extend_cell = f'{cell}≥≢⍴⍵:(⍴⍺)⍴⍵ ⋄ ' if cell >= 0 else ''
+            dfn = f'{{(⍴⍺)≡⍴⍵:⍵ ⋄ {extend_cell}⍉(⌽⍴⍺)⍴⍉⍵}}'
+            return ast.Call(func=self.call('Inline', ast.Constant(dfn)),
+                            args=[copy.deepcopy(like), arg], keywords=[])
+
+        # Otherwise, it's added to zeros shaped like the other argument under the same rank.
+        other = self.call('TimesDy', ast.Constant(0), copy.deepcopy(node.args[3-idx]))
+        args = [arg, other] if idx == 0 else [other, arg]
+        return self.call('JotDiaDyDy', ast.Name(id='AddDy', ctx=ast.Load()), copy.deepcopy(rank), *args)
+
+    def whole_array(self, node: ast.Call, dout: Optional[ast.AST]) -> ast.AST:
+        """
+        Applies the derivative of a scalar rank operand to the whole arguments.
+
+        Args:
+            node: Application of rank to the derivative, as a call to Autodiff.
+            dout: Derivative shaped like the result the derivative is multiplied
+                by, if any.
+
+        Returns:
+            The derivative, multiplied by dout.
+        """
+        node.args[2:] = [self.visit(arg) for arg in node.args[2:]]
+        name, idx, dyadic = (arg.value if isinstance(arg, ast.Constant) else arg.id
+                             for arg in node.args[0].args)
+        grad = scalar_grad(name, idx, dyadic)
+        grad = optimize.Substitute('out_g', dout if dout is not None else ast.Constant(1)).visit(grad)
+        if node.func.id == 'JotDiaDyMon':
+            return optimize.Substitute('Omega', node.args[2]).visit(grad)
+
+        used = {child.id for child in ast.walk(grad) if isinstance(child, ast.Name)}
+        for arg_idx, arg in enumerate(['Alpha', 'Omega']):
+            if arg in used:
+                grad = optimize.Substitute(arg, self.broadcast(node, arg_idx, dout)).visit(grad)
+        return grad
 
     def visit_Call(self, node):
         if isinstance(node.func, ast.Name) and node.func.id == 'Autodiff':
-            # Autodiff's third argument indicates the primitive's dyadic version
-            # is to be used.
-            if node.args[2].value:
-                node.args[0].id += 'Dy'
-            prim = getattr(self.prims, node.args[0].id)
-
-            # Directly calling a primitive isn't supported by Tangent,
-            # so an identity wrapper is used.
-            def wrapper(Omega):
-                return prim(Omega)
-
-            def wrapperDy(Alpha, Omega):
-                return prim(Alpha, Omega)
-
-            dprim = tangent.grad(wrapperDy if node.args[0].id.endswith('Dy') else wrapper,
-                                 wrt=(node.args[1].value,),
-                                 check_dims=False)
-            dprim = getsource(dprim).replace('prim', node.args[0].id)
-            dfn = change_dout_name(dprim, py_to_apl(dprim), 'out_g')
-
-            body = re.search(r'\{(.*?)\}', dfn, re.DOTALL).group(1)
-            anon = ('{out_g←1+0×⍵ ⋄ ' +
-                    ' ⋄ '.join([line.strip() for line in body.splitlines()[1:]]) +
-                    '}')
-
-            new_call = ast.Call(func=ast.Name(id='Inline', ctx=ast.Load()),
-                                args=[ast.Constant(anon)],
-                                keywords=[])
-            return ast.fix_missing_locations(new_call)
+            return ast.fix_missing_locations(self.inline(node))
+
+        if self.is_scalar_rank(node):
+            return ast.fix_missing_locations(ast.copy_location(self.whole_array(node, None), node))
+
+        # The derivatives rank is multiplied by are shaped like the result.
+        if (isinstance(node.func, ast.Name) and
+            node.func.id == 'TimesDy' and
+            self.is_scalar_rank(node.args[1])):
+            new_node = self.whole_array(node.args[1], self.visit(node.args[0]))
+            return ast.fix_missing_locations(ast.copy_location(new_node, node))
 
         return self.generic_visit(node)
 
 
+def preserve_result(dpy: ast.AST) -> ast.AST:
+    """
+    Moves the original function's output, which Tangent returns after the gradient
+    when asked to preserve it, in front of the gradient, so the derivative returns
+    output gradient (see also src/transpile/py_to_apl.py).
+
+    Args:
+        dpy: Derivative of the function as a Python module or function definition.
+
+    Returns:
+        The derivative, with its return value reordered in place.
+    """
+    func = dpy.body[0] if isinstance(dpy, ast.Module) else dpy
+    ret = func.body[-1]
+    if not isinstance(ret, ast.Return) or not isinstance(ret.value, ast.Tuple):
+        raise RuntimeError('The output of the function could not be preserved.')
+    ret.value.elts = ret.value.elts[-1:] + ret.value.elts[:-1]
+    return dpy
+
+
+class ReductionTransformer(ast.NodeTransformer):
+    """
+    Replaces reductions by addition, multiplication, maximum, and minimum with
+    dedicated functions whose adjoints are specialized, e.g., SlashMonMon(Add, x)
+    becomes SlashMonMonAdd(x), since Tangent picks adjoints by function alone.
+    The replacement is reverted, after differentiation, by passing specialize=False.
+
+    Args:
+        specialize: Flag to specialize reductions, as opposed to reverting them.
+    """
+    OPS = ('Add', 'Times', 'Max', 'Min')
+    REDUCTIONS = ('SlashMonMon', 'SlashbarMonMon')
+
+    def __init__(self, specialize: bool = True):
+        self.specialize = specialize
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if not isinstance(node.func, ast.Name):
+            return node
+
+        if (self.specialize and
+            node.func.id in self.REDUCTIONS and
+            isinstance(node.args[0], ast.Name) and
+            node.args[0].id in self.OPS):
+            return ast.copy_location(ast.Call(func=ast.Name(id=node.func.id+node.args[0].id, ctx=ast.Load()),
+                                              args=node.args[1:],
+                                              keywords=[]),
+                                     node)
+
+        for reduction, op in itertools.product(self.REDUCTIONS, self.OPS):
+            if not self.specialize and node.func.id == reduction+op:
+                return ast.copy_location(ast.Call(func=ast.Name(id=reduction, ctx=ast.Load()),
+                                                  args=[ast.Name(id=op, ctx=ast.Load()), *node.args],
+                                                  keywords=[]),
+                                         node)
+
+        return node
+
+
+def forward_over_reverse(dpy: ast.AST) -> ast.AST:
+    """
+    Differentiates a Python gradient in forward mode, giving the Hessian-vector
+    product of the original function (see src/hvp.py).
+
+    Args:
+        dpy: Python gradient, as a module.
+
+    Returns:
+        Python Hessian-vector product, whose argument following Omega is the vector.
+
+    Raises:
+        RuntimeError: The gradient can't be differentiated.
+    """
+    import tangent
+
+    dpy = optimize.dce(optimize.simplify(hvp.encode(dpy)))
+    dpy = ReductionTransformer().visit(dpy)
+
+    func = compile_function(astor.to_source(dpy), dpy.body[0].name)
+    try:
+        # The gradient is optimized after being differentiated, and Tangent's
+        # optimizations are unaware of the selection expressions in strings.
+        with stage('tangent'):
+            dfunc = tangent.autodiff(func, mode='forward', optimized=False, check_dims=False)
+            dpy = ast.parse(getsource(dfunc))
+
+    finally:
+        unregister_function(func)
+
+    dpy = hvp.decode(dpy)
+    with stage('inline_derivatives'):
+        dpy = AutodiffTransformer().visit(dpy)
+        dpy = TangentTransformer().visit(dpy)
+        dpy = ReductionTransformer(specialize=False).visit(dpy)
+        dpy = optimize.fuse_selections(dpy)
+    return dpy
+
+
 def autodiff(
     apl: str,
-    aplparse: str,
+    aplparse: Union[str, Aplparse],
     print_py: bool = False,
     print_dpy: bool = False,
+    cse: bool = True,
+    dce: bool = True,
+    simplify: bool = True,
+    batch: Union[bool, Sequence[int]] = False,
+    value_and_grad: bool = False,
+    checkpoint: Union[bool, Sequence[str]] = False,
+    release: bool = True,
+    stats: Optional[Dict] = None,
+    wrt: Optional[Sequence[int]] = None,
+    mode: str = 'reverse',
     ) -> str:
     """
     Generates the derivative of an APL dfn.
 
     Args:
         apl: APL dfn whose derivative is generated.
-        aplparse: Path to aplparse executable.
+        aplparse: Path to aplparse executable or a parsing session (see
+            src/transpile/apl_to_py.py).
         print_py: Flag to print the transpiled Python code.
         print_dpy: Flag to print the derivative of the transpiled Python code.
+        cse: Flag to eliminate common subexpressions from the derivative (see
+            src/optimize.py). Turning it off can help with debugging.
+        dce: Flag to fold arithmetic involving zero gradients and eliminate dead
+            code from the derivative (see src/optimize.py).
+        simplify: Flag to fold literal arithmetic and remove applications of functions
+            to their identity elements in the derivative (see src/optimize.py).
+        batch: Flag to lift the derivative to a batch of examples stacked along a
+            leading axis of the argument, giving per-example gradients, or the 1-based
+            indices of the batched items if the argument is nested (see src/batch.py).
+            The output's derivative, ⍺, then holds that of each example's output.
+        value_and_grad: Flag to have the derivative return the original dfn's output
+            alongside the gradient, as output gradient, reusing the forward pass.
+        checkpoint: Flag to keep only every ⌈√n⌉th intermediate result of the forward
+            pass for the backward pass and recompute the rest, or the names of the
+            variables to keep (see src/checkpoint.py).
+        release: Flag to release variables right after their last use in the derivative
+            (see src/optimize.py).
+        stats: Dictionary to record statistics of the derivative in, currently the
+            peak number of simultaneously live variables, under 'peak_live'.
+        wrt: 1-based indices of the items of the nested argument to differentiate
+            with respect to, such as a network's parameters as opposed to its data.
+            The gradients of the other items are zero, and the code computing them
+            is pruned (see src/optimize.py). By default, every item is differentiated.
+        mode: 'reverse' to generate the vector-Jacobian product, with ⍺ being the
+            output's derivative, or 'forward' to generate the Jacobian-vector product,
+            with ⍺ being the argument's tangent, which is cheaper when the output
+            is much larger than the argument, or 'hvp' to generate the Hessian-vector
+            product of a dfn with a scalar output, with ⍺ being the vector (see src/hvp.py),
+            or 'jacobian' to generate the vector-Jacobian products of a stack of output
+            derivatives along a leading axis of ⍺ in one sweep, e.g., the Jacobian, given
+            the identity matrix (see src/batch.py).
 
     Returns:
         Derivative of the passed dfn as APL source code.
 
     Raises:
+        ValueError: The options aren't supported in the requested mode.
+        CalledProcessError: aplparse failed to execute.
+        SyntaxError: The built-in parser failed to parse the dfn.
         Exception: The derivative couldn't be generated.
     """
-    py = apl_to_py(apl, aplparse)
-
-    if print_py:
-        print('Transpiled Python code:\n', py)
+    # Tangent, and numpy and gast with it, take long to import, so they're only
+    # imported once a derivative is actually generated, not by cached runs of ada.
+    with stage('import_tangent'):
+        import tangent
 
-    # The following check for known limitations of the adjoints.
-    # Traversing the AST to match these cases is more elegant and robust,
-    # but a regex strategy works fine, too.
-    if len(re.findall(r'CircDy\((?=(1|2))', py)) != py.count('CircDy('):
-        raise RuntimeError('Sin and cos are the only supported trig functions.')
+    if mode not in ('reverse', 'forward', 'hvp', 'jacobian'):
+        raise ValueError(f'Unknown mode {mode}.')
 
-    if len(re.findall(r'DotDyDy\((?=Add, Times)', py)) != py.count('DotDyDy('):
-        raise RuntimeError('The only supported inner product is matrix multiplication.')
+    if mode in ('forward', 'hvp') and (value_and_grad or checkpoint is not False or wrt is not None):
+        raise ValueError('Returning the output, checkpointing, and differentiating '
+                         'with respect to some items are only supported in reverse mode.')
 
-    if re.search(r'JotDia\w+\([a-zA-Z]+, [a-zA-Z]+', py):
-        raise RuntimeError('Jot Diaeresis support only extends to rank with scalar right operands.')
+    if mode == 'jacobian' and batch is not False:
+        raise ValueError('Jacobians of batches of examples are not supported.')
 
-    if re.search(r'JotDia\w+\((?=(Cat|Disclose|Drop|Enclose|In|Iota|Row|Squad|Trans|Vcat))', py):
-        raise RuntimeError('Rank does not support structural or selection functions.')
+    py = apl_to_py(apl, aplparse)
+    with stage('preprocess'):
+        check_limitations(py)
+        py = ReductionTransformer().visit(py)
 
-    if len(re.findall(r'SlashMonMon\((?=(Add|And|Max|Min|Or|Times))', py)) != py.count('SlashMonMon('):
-        raise RuntimeError('Reduce only works with associative functions.')
+        # Tangent reads the function's source, so the AST is serialized for it,
+        # but only this once.
+        py_src = astor.to_source(py)
 
-    if len(re.findall(r'SlashbarMonMon\((?=(Add|And|Max|Min|Or|Times))', py)) != py.count('SlashbarMonMon('):
-        raise RuntimeError('Reduce first only works with associative functions.')
+    if print_py:
+        print('Transpiled Python code:\n', py_src)
 
-    # Tangent expects a function, and since the transpiled Python code
-    # is generated at runtime, it's saved to a temporary file and then loaded.
-    # Declaring it via exec wouldn't work because the source would be inaccessible.
-    with open(f'prims.py', 'w+') as f:
-        f.write(prims_str + '\n' + py)
+    # Tangent expects a function whose source is accessible, so the transpiled
+    # Python code is compiled in memory with its source registered (see compile_function).
+    # Only the function itself is compiled per call; the primitives and adjoints
+    # are shared by every call in the process.
+    with stage('compile'):
+        func = compile_function(py_src, py.body[0].name)
 
     try:
-        import prims
-        imp.reload(prims)
-
-        name = re.search(r'def\s+(\w+)\s*\(', py).group(1) # Gets the function's name.
-        dpy = getsource(tangent.grad(getattr(prims, name), check_dims=False))
-        dpy = astor.to_source(AutodiffTransformer(prims).visit(ast.parse(dpy)))
-
-        # These are Tangent utilities for initializing, summing, and copying derivatives,
-        # which are reformulated using their APL equivalents.
-        dpy = dpy.replace('tangent.init_grad(', 'TimesDy(0, ')
-        dpy = dpy.replace('tangent.add_grad', 'AddDy')
-        dpy = dpy.replace('tangent.copy', '') # APL deep-copies on each assignment.
-
-        # A stack is maintained by Tangent to handle calls to other function, which isn't
-        # supported by the transpiler. Lines relating to it can be safely erased
-        # since the stack's items are primitives only.
-        filtered_lines = filter(lambda x: not any(sub in x for sub in ['tangent.Stack',
-                                                                       'tangent.push',
-                                                                       'tangent.pop',
-                                                                       '= None']),
-                                dpy.splitlines())
-        dpy = '\n'.join(list(filtered_lines))
-
-    except Exception as e:
-        print(f'Failed to generate derivative: {e}')
-        sys.exit(1)
+        # Tangent's derivative is parsed once, and every subsequent stage
+        # transforms the AST rather than source code.
+        # In forward mode, the tangents in prims_str are used in place of the adjoints.
+        with stage('tangent'):
+            if mode == 'forward':
+                dfunc = tangent.autodiff(func, mode='forward', check_dims=False)
+            else:
+                dfunc = tangent.grad(func, preserve_result=value_and_grad, check_dims=False)
+            dpy = ast.parse(getsource(dfunc))
+        if value_and_grad:
+            dpy = preserve_result(dpy)
+        # The derivatives of primitives generated on the way are timed separately too.
+        with stage('inline_derivatives'):
+            dpy = AutodiffTransformer(differentiable=mode == 'hvp').visit(dpy)
+            dpy = TangentTransformer().visit(dpy)
+            dpy = ReductionTransformer(specialize=False).visit(dpy)
+            dpy = optimize.fuse_selections(dpy)
+        if mode == 'hvp':
+            with stage('hvp'):
+                dpy = forward_over_reverse(dpy)
+        if wrt is not None:
+            with stage('prune_inactive'):
+                dpy = optimize.prune_inactive(dpy, wrt)
+        if simplify:
+            with stage('simplify'):
+                dpy = optimize.simplify(dpy)
+        if dce:
+            with stage('dce'):
+                dpy = optimize.dce(dpy)
+        # Jacobians are obtained by batching the output's derivative alone.
+        if batch is not False or mode == 'jacobian':
+            with stage('batch'):
+                dpy = lift(dpy, batch)
+        if cse:
+            with stage('cse'):
+                dpy = optimize.cse(dpy)
+        if checkpoint is not False:
+            with stage('checkpoint'):
+                dpy = rematerialize(dpy, checkpoint)
+        if release:
+            with stage('release'):
+                dpy = optimize.release_dead(dpy, stats)
 
     finally:
-        Path('prims.py').unlink()
+        unregister_function(func)
 
     if print_dpy:
-        print('Python derivative:\n', dpy)
-
-    apl = py_to_apl(dpy)
-    return change_dout_name(dpy, apl)
+        print('Python derivative:\n', astor.to_source(dpy))
+
+    # Tangent names derivatives in forward mode differently, e.g., _tftOmega,
+    # so every mode's is named as in reverse mode.
+    dpy.body[0].name = f'd{py.body[0].name}dOmega'
+    with stage('py_to_apl'):
+        dapl = py_to_apl(change_dout_name(dpy))
+    count('derivative_statements', len(dpy.body[0].body))
+    return dapl
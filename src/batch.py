@@ -0,0 +1,327 @@
+"""
+Batching of derivatives over a leading axis of examples.
+
+A derivative generated for a single example is lifted to a batch of examples
+stacked along a new leading axis, giving per-example gradients in one call.
+The statements of the Python derivative are rewritten one by one while
+tracking which variables are batched, so only the computations depending on
+the batch are touched:
+
+I) Pervasive functions apply to batched arrays as they are, with rank
+selecting the matching examples when both arguments aren't equally batched.
+II) Shapes and tallies are those of a single example, e.g., ⍴x becomes 1↓⍴x.
+Reshapes prepend the batch size if they provably keep each example's elements,
+and are otherwise applied to each example, since APL's reshape cycles through
+the whole array and would mix examples up.
+III) Inner products with a shared right argument and reductions and scans
+along the last axis apply to batched arrays as they are, while those along the
+first axis and transposes have their axes shifted past the batch axis, e.g.,
++⌿x becomes +⌿[2]x and ⍉x becomes (1,1+⌽⍳¯1+≢⍴x)⍉x.
+IV) Every other function, operators included, is applied to each example with
+rank ¯1, e.g., x+.×y becomes x({⍺(+.×)⍵}⍤¯1)y when both are batched.
+
+The argument ⍵ may be batched in its entirety, or, if it is nested, only some
+of its items may be. In the latter case, the items are tracked individually
+when they're picked or selectively assigned. The output's derivative, ⍺, is
+always batched, i.e., it holds the derivative of each example's output.
+
+If the argument isn't batched at all, only the output's derivative is, and
+its rows are seeds propagated together through the same derivative. With an
+identity matrix as the seeds, the result's rows form the Jacobian.
+"""
+
+
+import ast
+from typing import AbstractSet, Dict, List, Sequence, Tuple, Union
+
+from .optimize import Substitute
+from .transpile.py_to_apl import NAME_TO_GLYPH, OP_TO_GLYPH, Unparse
+
+
+# Batch status of a value: False if it's shared by all examples, True if it has
+# a leading batch axis, and the indices of the batched items if it's a nested
+# vector only some of whose items are batched.
+Status = Union[bool, AbstractSet[int]]
+
+PERVASIVE_MON = {'Circ', 'Circstar', 'Div', 'Max', 'Min', 'Pipe', 'Pow', 'Sub', 'Tilde', 'Times'}
+PERVASIVE_DY = {name+'Dy' for name in ['Add', 'And', 'Circ', 'Circstar', 'Div', 'Eq', 'Gt',
+                                       'Gteq', 'Lt', 'Lteq', 'Max', 'Min', 'Nand', 'Nor',
+                                       'Or', 'Pipe', 'Pow', 'Sub', 'Times']}
+
+
+def call(func: Union[str, ast.AST], *args: ast.AST) -> ast.Call:
+    """
+    Creates a call node.
+    """
+    func = ast.Name(id=func, ctx=ast.Load()) if isinstance(func, str) else func
+    return ast.Call(func=func, args=list(args), keywords=[])
+
+
+def inline(apl: str) -> ast.Call:
+    """
+    Creates a node inlining APL code.
+    """
+    return call('Inline', ast.Constant(apl))
+
+
+def is_batched(status: Status) -> bool:
+    return status is True or (not isinstance(status, bool) and bool(status))
+
+
+def keeps_count(shape: ast.AST, array: ast.AST) -> bool:
+    """
+    Checks if reshaping a batched array provably keeps the number of elements
+    of each example, namely, if the shape, once batched, is that of an example
+    of the array, possibly with a leading or trailing 1, as in (⍴x),1.
+    """
+    def is_one(arg: ast.AST) -> bool:
+        return isinstance(arg, ast.Constant) and arg.value == 1
+
+    if (isinstance(shape, ast.Call) and isinstance(shape.func, ast.Name) and
+        shape.func.id == 'CatDy' and any(map(is_one, shape.args))):
+        shape = shape.args[1] if is_one(shape.args[0]) else shape.args[0]
+    return ast.dump(shape) == ast.dump(call('DropDy', ast.Constant(1), call('Rho', array)))
+
+
+class Batcher:
+    """
+    Lifts a derivative to a batch of examples.
+
+    Args:
+        func: Python derivative, modified in place.
+        batch: True if the argument is batched in its entirety, the indices
+            of its batched items, or False if it isn't batched.
+    """
+    def __init__(self, func: ast.FunctionDef, batch: Union[bool, Sequence[int]]):
+        self.func = func
+        args = [arg.arg for arg in func.args.args]
+        dout = args[args.index('Omega')+1]
+        self.statuses: Dict[str, Status] = {
+            'Omega': batch if isinstance(batch, bool) else frozenset(batch),
+            dout: True,
+            }
+
+    def rank(self, node: ast.Call, arrays: List[int], statuses: List[Status]) -> ast.Call:
+        """
+        Applies a call to each example with rank ¯1.
+
+        Args:
+            node: Call to apply.
+            arrays: Indices of the call's array arguments, the remaining ones being operands.
+            statuses: Batch statuses of the array arguments.
+
+        Returns:
+            The call, applied with rank.
+        """
+        if any(not isinstance(status, bool) for status in statuses):
+            raise RuntimeError('Batching does not support partially batched arguments '
+                               'to functions other than pick and addition.')
+
+        ranks = ' '.join('¯1' if status else '99' for status in statuses)
+        if len(arrays) == 1:
+            ranks = '¯1'
+
+        if isinstance(node.func, ast.Name) and node.func.id in NAME_TO_GLYPH and node.func.id not in OP_TO_GLYPH:
+            if len(arrays) == 1:
+                return call('JotDiaDyMon', node.func, inline(ranks), node.args[0])
+            return call('JotDiaDyDy', node.func, inline(ranks), *node.args)
+
+        # Otherwise, the call is wrapped in a dfn, with its array arguments
+        # replaced by ⍺ and ⍵.
+        names = ['Omega'] if len(arrays) == 1 else ['Alpha', 'Omega']
+        args = list(node.args)
+        for idx, name in zip(arrays, names):
+            args[idx] = ast.Name(id=name, ctx=ast.Load())
+        dfn = '{'+Unparse.node(ast.Call(func=node.func, args=args, keywords=[]))+'}'
+        return call(inline(f'({dfn}⍤{ranks})'), *[node.args[idx] for idx in arrays])
+
+    def expr(self, node: ast.AST) -> Tuple[ast.AST, Status]:
+        """
+        Batches an expression.
+
+        Args:
+            node: Expression to batch.
+
+        Returns:
+            The batched expression and its batch status.
+        """
+        if isinstance(node, ast.Name):
+            return node, self.statuses.get(node.id, False)
+
+        if not isinstance(node, ast.Call):
+            return node, False
+
+        # Inlined code and operands are shared.
+        if isinstance(node.func, ast.Name) and node.func.id == 'Inline':
+            return node, False
+
+        name = node.func.id if isinstance(node.func, ast.Name) else None
+        if name is not None and name in OP_TO_GLYPH:
+            n_operands = 1 if name.startswith(tuple(op+'Mon' for op in OP_TO_GLYPH)) else 2
+        else:
+            n_operands = 0
+        arrays = list(range(n_operands, len(node.args)))
+
+        batched = [self.expr(node.args[idx]) for idx in arrays]
+        for idx, (arg, _) in zip(arrays, batched):
+            node.args[idx] = arg
+        statuses = [status for _, status in batched]
+
+        if not any(map(is_batched, statuses)):
+            return node, False
+
+        if name in ('Disclose', 'DiscloseDy') and not isinstance(statuses[-1], bool):
+            pick = node.args[0] if name == 'DiscloseDy' else ast.Constant(1)
+            if not isinstance(pick, ast.Constant):
+                raise RuntimeError('Batching requires items of partially batched '
+                                   'arguments to be picked by constant indices.')
+            return node, pick.value in statuses[-1]
+
+        if name == 'TimesDy' and not isinstance(statuses[1], bool) and statuses[0] is False:
+            return node, statuses[1]
+
+        if name == 'AddDy' and all(not isinstance(status, bool) for status in statuses):
+            if statuses[0] != statuses[1]:
+                raise RuntimeError('Batching does not support adding differently batched items.')
+            return node, statuses[0]
+
+        if name in PERVASIVE_MON and isinstance(statuses[0], bool):
+            return node, True
+
+        # Scalar literals extend to every example, but otherwise, examples
+        # might differ in rank, so they're matched with rank.
+        if name in PERVASIVE_DY and all(isinstance(status, bool) for status in statuses):
+            if any(isinstance(arg, (ast.Constant, ast.UnaryOp)) for arg in node.args):
+                return node, True
+            return self.rank(node, arrays, statuses), True
+
+        # Shapes and tallies are those of a single example.
+        if name == 'Rho' and statuses[0] is True:
+            return call('DropDy', ast.Constant(1), node), False
+
+        if name == 'Nmatch' and statuses[0] is True:
+            return call('Disclose', call('CatDy', call('DropDy', ast.Constant(1), call('Rho', node.args[0])),
+                                         ast.Constant(1))), False
+
+        # Reshapes that keep each example's elements just prepend the batch size,
+        # but others, like those broadcasting derivatives, would mix examples
+        # up, so they're applied to each example with rank.
+        if name == 'RhoDy' and statuses == [False, True] and keeps_count(*node.args):
+            node.args[0] = call('CatDy', call('Nmatch', node.args[1]), node.args[0])
+            return node, True
+
+        # Inner products contract the last axis of their left argument with
+        # the first one of their right argument, so a shared right argument
+        # is applied to every example as it is.
+        if name == 'DotDyDy' and statuses == [True, False]:
+            return node, True
+
+        # Reductions and scans along the last axis leave the batch axis alone,
+        # and those along the first axis move to the second one.
+        if name in ('SlashMonMon', 'BackslashMonMon') and statuses[0] is True:
+            return node, True
+
+        if name in ('SlashbarMonMon', 'BackslashbarMonMon') and statuses[0] is True:
+            op = Unparse.node(node.args[0])+NAME_TO_GLYPH[name]
+            return call(inline(f'{op}[2]'), node.args[1]), True
+
+        # Transposes keep the batch axis first.
+        if name == 'Trans' and statuses[0] is True:
+            return call(inline('{(1,1+⌽⍳¯1+≢⍴⍵)⍉⍵}'), node.args[0]), True
+
+        if name == 'TransDy' and statuses == [False, True]:
+            node.args[0] = call('CatDy', ast.Constant(1), call('AddDy', ast.Constant(1), node.args[0]))
+            return node, True
+
+        return self.rank(node, arrays, statuses), True
+
+    def selective_assign(self, stmt: ast.Assign) -> List[ast.stmt]:
+        """
+        Batches a selective assignment.
+        """
+        target = stmt.targets[0].id
+        sel, val, base = stmt.value.args
+        val, val_status = self.expr(val)
+        stmt.value.args[1] = val
+        base_status = self.statuses.get(base.id, False)
+
+        # Items of partially batched arrays are assigned as they are.
+        if not isinstance(base_status, bool):
+            if not (isinstance(sel, ast.Call) and
+                    isinstance(sel.func, ast.Name) and
+                    sel.func.id in ('Disclose', 'DiscloseDy') and
+                    (sel.func.id == 'Disclose' or isinstance(sel.args[0], ast.Constant))):
+                raise RuntimeError('Batching only supports picking items of partially '
+                                   'batched arguments by constant indices.')
+            pick = 1 if sel.func.id == 'Disclose' else sel.args[0].value
+            if val_status is True:
+                base_status = base_status | {pick}
+            elif not val_status:
+                base_status = base_status - {pick}
+            else:
+                raise RuntimeError('Batching does not support nested partially batched items.')
+            self.statuses[base.id] = self.statuses[target] = base_status
+            return [stmt]
+
+        if not is_batched(base_status) and not is_batched(val_status):
+            self.statuses[target] = False
+            return [stmt]
+
+        if any(self.statuses.get(node.id) for node in ast.walk(sel)
+               if isinstance(node, ast.Name) and node.id != base.id):
+            raise RuntimeError('Batching does not support selections with batched indices.')
+
+        stmts: List[ast.stmt] = []
+        # Shared arrays are given a batch axis before being assigned into.
+        if not is_batched(base_status):
+            broadcast = call('RhoDy', call('CatDy', call('Nmatch', val), call('Rho', base)), base)
+            stmts.append(ast.Assign(targets=[ast.Name(id=base.id, ctx=ast.Store())], value=broadcast))
+
+        # The selective assignment is performed on each example within a dfn.
+        sel = Unparse.node(Substitute(base.id, '_z').visit(sel))
+        dfn = f'{{_z←⍵ ⋄ ({sel})←⍺ ⋄ _z}}'
+        ranks = '¯1' if is_batched(val_status) else '99 ¯1'
+        stmts.append(ast.Assign(targets=[ast.Name(id=base.id, ctx=ast.Store())],
+                                value=call(inline(f'({dfn}⍤{ranks})'), val, base)))
+        if target != base.id:
+            stmts.append(ast.Assign(targets=[ast.Name(id=target, ctx=ast.Store())],
+                                    value=ast.Name(id=base.id, ctx=ast.Load())))
+        self.statuses[base.id] = self.statuses[target] = True
+        return stmts
+
+    def run(self) -> None:
+        body: List[ast.stmt] = []
+        for stmt in self.func.body:
+            if (isinstance(stmt, ast.Assign) and
+                isinstance(stmt.value, ast.Call) and
+                isinstance(stmt.value.func, ast.Name) and
+                stmt.value.func.id == 'SelectiveAssign'):
+                body.extend(self.selective_assign(stmt))
+                continue
+
+            stmt.value, status = self.expr(stmt.value)
+            if isinstance(stmt, ast.Assign):
+                self.statuses[stmt.targets[0].id] = status
+            body.append(stmt)
+        self.func.body = body
+
+
+def lift(py: ast.AST, batch: Union[bool, Sequence[int]] = True) -> ast.AST:
+    """
+    Lifts a Python derivative to a batch of examples stacked along a leading axis.
+
+    Args:
+        py: Python derivative, as a module or a function definition.
+        batch: True if the derivative's argument is batched in its entirety,
+            the 1-based indices of the batched items of a nested argument, or
+            False if only the output's derivative is batched.
+
+    Returns:
+        The derivative, batched in place.
+
+    Raises:
+        RuntimeError: The derivative can't be batched.
+    """
+    func = py.body[0] if isinstance(py, ast.Module) else py
+    Batcher(func, batch).run()
+    return py
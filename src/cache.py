@@ -0,0 +1,154 @@
+"""
+Persistent, content-addressed cache of derivatives.
+"""
+
+
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Optional, Union
+
+
+def default_cache_dir() -> Path:
+    """
+    Returns the default cache directory, ~/.cache/ada, honouring XDG_CACHE_HOME.
+    """
+    return Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'ada'
+
+
+def normalize(apl: str) -> str:
+    """
+    Normalizes the formatting of a dfn so that whitespace-only edits
+    map to the same cache entry. Runs of whitespace outside of character
+    literals are collapsed and blank lines are dropped.
+
+    Args:
+        apl: APL dfn to normalize.
+
+    Returns:
+        Normalized dfn.
+    """
+    lines = []
+    for line in apl.splitlines():
+        line = re.sub(r"('[^']*')|\s+", lambda m: m.group(1) or ' ', line).strip()
+        if line:
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+class DerivativeCache:
+    """
+    On-disk cache mapping dfns to their derivatives. An entry's key is a hash
+    of the normalized dfn, whatever options the derivative was generated with,
+    and what generated it, i.e., the adjoint definitions, the package's version
+    and sources, and Tangent's version (see prims_hash in src/autodiff.py),
+    so that editing any of them invalidates the stale entries. Once the entries exceed
+    the size limit, the least recently used ones are evicted.
+
+    Args:
+        path: Cache directory. If None, ~/.cache/ada is used.
+        max_size: Maximum total size of the entries in bytes.
+    """
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        max_size: int = 64 * 2**20,
+        ) -> None:
+        self.path = Path(path) if path is not None else default_cache_dir()
+        self.max_size = max_size
+
+    def key(self, apl: str, **options) -> str:
+        """
+        Computes the key of a dfn's derivative.
+
+        Args:
+            apl: APL dfn.
+            **options: Options the derivative is generated with.
+
+        Returns:
+            Key of the dfn's derivative.
+        """
+        from .autodiff import prims_hash
+
+        digest = hashlib.sha256()
+        for part in [prims_hash(), normalize(apl), repr(sorted(options.items()))]:
+            digest.update(part.encode())
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def entry(self, key: str) -> Path:
+        """
+        Returns the path of an entry given its key.
+        """
+        return self.path / f'{key}.apl'
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Looks a derivative up, marking it as recently used.
+
+        Args:
+            key: Key of the derivative.
+
+        Returns:
+            The cached derivative, or None if it isn't cached.
+        """
+        entry = self.entry(key)
+        try:
+            dapl = entry.read_text(encoding='utf-8')
+            os.utime(entry)
+
+        except OSError:
+            return None
+
+        return dapl
+
+    def put(self, key: str, dapl: str) -> None:
+        """
+        Caches a derivative and evicts the least recently used entries
+        if the cache has outgrown its size limit.
+
+        Args:
+            key: Key of the derivative.
+            dapl: Derivative to cache.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        # The entry is written to a temporary file first and then moved into place
+        # so that concurrent runs never read a partially written entry.
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(dapl)
+        os.replace(tmp, self.entry(key))
+
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Evicts the least recently used entries until the cache fits its size limit.
+        """
+        entries = []
+        for entry in self.path.glob('*.apl'):
+            try:
+                stat = entry.stat()
+
+            except OSError:
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, entry))
+
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, entry in sorted(entries):
+            if size <= self.max_size:
+                break
+
+            entry.unlink(missing_ok=True)
+            size -= entry_size
+
+    def clear(self) -> None:
+        """
+        Removes every entry.
+        """
+        for entry in self.path.glob('*.apl'):
+            entry.unlink(missing_ok=True)
@@ -0,0 +1,136 @@
+"""
+Gradient checkpointing of derivatives.
+
+A derivative first runs the original function's forward pass and then the
+backward pass, which reads the forward pass's intermediate results. Rather
+than keeping every intermediate alive until the end, only some, the
+checkpoints, are kept, and the rest are released once the forward pass is
+done with them and recomputed from the checkpoints right before the
+backward pass first needs them. Memory then scales with the number of
+checkpoints plus the size of the recomputed segments, in exchange for
+running parts of the forward pass twice.
+
+Checkpoints are either chosen by the user or placed every ⌈√n⌉ statements
+of a forward pass of n statements, which balances the two.
+"""
+
+
+import ast
+import copy
+import math
+from typing import Dict, List, Sequence, Set, Union
+
+from .optimize import used_names as names
+
+
+def defined(stmt: ast.stmt) -> List[str]:
+    """
+    Returns the names of the variables a statement assigns, selective
+    assignment's base included.
+    """
+    if not isinstance(stmt, ast.Assign):
+        return []
+
+    targets = [target.id for target in stmt.targets]
+    if (isinstance(stmt.value, ast.Call) and
+        isinstance(stmt.value.func, ast.Name) and
+        stmt.value.func.id == 'SelectiveAssign'):
+        targets.append(stmt.value.args[2].id)
+    return targets
+
+
+def release(name: str) -> ast.Assign:
+    """
+    Creates a statement releasing the memory held by a variable.
+    """
+    return ast.Assign(targets=[ast.Name(id=name, ctx=ast.Store())],
+                      value=ast.Call(func=ast.Name(id='Inline', ctx=ast.Load()),
+                                     args=[ast.Constant('⍬')],
+                                     keywords=[]))
+
+
+def rematerialize(py: ast.AST, checkpoints: Union[bool, Sequence[str]] = True) -> ast.AST:
+    """
+    Checkpoints a Python derivative, keeping only the checkpoints of the forward
+    pass alive for the backward pass and recomputing the other intermediates.
+
+    Args:
+        py: Python derivative, as a module or a function definition.
+        checkpoints: Names of the variables to keep, or True to place
+            checkpoints every ⌈√n⌉ statements of the forward pass. Variables
+            assigned more than once are always kept.
+
+    Returns:
+        The derivative, checkpointed in place.
+    """
+    func = py.body[0] if isinstance(py, ast.Module) else py
+    args = [arg.arg for arg in func.args.args]
+    dout = args[args.index('Omega')+1]
+
+    # The backward pass starts with the first statement reading the output's derivative.
+    split = next((idx for idx, stmt in enumerate(func.body) if dout in names(stmt.value)),
+                 len(func.body))
+    forward, backward = func.body[:split], func.body[split:]
+
+    n_defs: Dict[str, int] = {}
+    for stmt in func.body:
+        for name in defined(stmt):
+            n_defs[name] = n_defs.get(name, 0)+1
+
+    if checkpoints is True:
+        step = max(math.ceil(math.sqrt(len(forward))), 1)
+        checkpoints = [defined(stmt)[0] for idx, stmt in enumerate(forward)
+                       if idx % step == step-1 and defined(stmt)]
+
+    # Variables that are reassigned, or that depend on reassigned ones,
+    # can't be recomputed from their definitions.
+    defs = {stmt.targets[0].id: stmt for stmt in forward
+            if isinstance(stmt, ast.Assign) and len(defined(stmt)) == 1}
+    recomputed = {name for name, stmt in defs.items()
+                  if name not in checkpoints and
+                  all(n_defs.get(dep, 0) <= 1 for dep in names(stmt.value) | {name})}
+    if not recomputed:
+        return py
+
+    # Intermediates the rest of the forward pass doesn't use are left to the backward pass.
+    kept: List[ast.stmt] = []
+    used: Set[str] = set()
+    for stmt in reversed(forward):
+        if isinstance(stmt, ast.Assign) and stmt.targets[0].id in recomputed and stmt.targets[0].id not in used:
+            continue
+        kept.insert(0, stmt)
+        used |= names(stmt.value)
+
+    # The others are released after their last use in the forward pass.
+    last_use = {name: idx for idx, stmt in enumerate(kept)
+                for name in names(stmt.value) | set(defined(stmt)) if name in recomputed}
+    new_forward: List[ast.stmt] = []
+    for idx, stmt in enumerate(kept):
+        new_forward.append(stmt)
+        new_forward.extend(release(name) for name in sorted(recomputed)
+                           if last_use.get(name) == idx)
+
+    # Before the backward pass first reads an intermediate, it's recomputed, along with
+    # the intermediates it depends on, from the checkpoints.
+    available: Set[str] = set()
+
+    def recompute(name: str) -> List[ast.stmt]:
+        if name not in recomputed or name in available:
+            return []
+        available.add(name)
+
+        stmts = []
+        for dep in sorted(names(defs[name].value)):
+            stmts.extend(recompute(dep))
+        stmts.append(ast.Assign(targets=[ast.Name(id=name, ctx=ast.Store())],
+                                value=copy.deepcopy(defs[name].value)))
+        return stmts
+
+    new_backward: List[ast.stmt] = []
+    for stmt in backward:
+        for name in sorted(names(stmt.value)):
+            new_backward.extend(recompute(name))
+        new_backward.append(stmt)
+
+    func.body = new_forward+new_backward
+    return ast.fix_missing_locations(py)
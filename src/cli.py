@@ -5,19 +5,96 @@ The ada command-line tool reads a file containing APL dfns,
 computes their derivatives, and writes the results to a new file.
 
 Usage:
-    ada <apl> <aplparse>
+    ada <apl> [aplparse] [--parser {aplparse,python}] [--jobs N] [--no-cache]
+        [--no-cse] [--no-dce] [--no-simplify] [--batch [I ...]] [--value-and-grad]
+        [--checkpoint [NAME ...]] [--no-release] [--wrt I [I ...]]
+        [--mode {reverse,forward,hvp,jacobian}] [--profile PATH] [--output PATH]
+    ada serve [aplparse] [--parser {aplparse,python}] [--socket PATH] [--no-cache]
+
+The latter keeps ada running and differentiates dfns on request (see src/serve.py).
 
 Args:
     apl: Path to APL file of dfns to differentiate.
-    aplparse: Path to aplparse executable.
+    aplparse: Path to aplparse executable, unless the built-in parser is used.
+    parser: Parser of the dfns, either aplparse or the built-in Python parser.
+    jobs: Number of worker processes differentiating dfns in parallel.
+    no-cache: Flag to neither read from nor write to the derivative cache.
+    no-cse: Flag to keep common subexpressions in the derivatives, for debugging.
+    no-dce: Flag to keep zero gradients and dead code in the derivatives, for debugging.
+    no-simplify: Flag to keep the derivatives' expressions unsimplified, for debugging.
+    batch: Flag to differentiate over a leading batch axis of the argument, or the indices
+        of the batched items if the argument is nested, to obtain per-example gradients.
+    value-and-grad: Flag to have the derivatives return the dfns' outputs alongside the gradients.
+    checkpoint: Flag to recompute intermediate results of the forward pass in the backward pass
+        instead of keeping them, except every ⌈√n⌉th one, or the names of those to keep.
+    no-release: Flag to keep variables in the derivatives alive until they return.
+    wrt: Indices of the items of the nested argument to differentiate with respect to.
+    mode: Reverse mode to generate vector-Jacobian products, or forward mode to generate
+        Jacobian-vector products, which suits dfns with small arguments and large outputs,
+        hvp mode to generate Hessian-vector products of dfns with scalar outputs, or jacobian
+        mode to generate derivatives taking a stack of output derivatives, e.g., an identity matrix.
+    profile: Path of a JSON, if it ends with .json, or CSV report of the time spent
+        in each stage of differentiating each dfn and the size of its derivative.
+    output: Path of the file the derivatives are written to, by default that of the APL file
+        with a 'd' prefixed to its name.
 """
 
 
+# Parsing session of a worker process when differentiating in parallel.
+_session = None
+
+
+def _init_worker(session_cls, aplparse, trees):
+    """
+    Sets up a worker process with its own parsing session, seeded with
+    the parse trees computed by the parent process.
+    """
+    from multiprocessing.util import Finalize
+
+    global _session
+    _session = session_cls(aplparse)
+    _session.trees.update(trees)
+    Finalize(_session, _session.close, exitpriority=10)
+
+
+def _run(apl, session, **options):
+    """
+    Differentiates a dfn, returning the derivative, its statistics, and
+    the profile of its differentiation (see src/profiling.py).
+    """
+    from .autodiff import autodiff
+    from .profiling import profiling, stage
+
+    stats = {}
+    with profiling() as profile:
+        with stage('total'):
+            dapl = autodiff(apl, session, stats=stats, **options)
+    return dapl, stats, profile.as_dict()
+
+
+def _differentiate(apl, **options):
+    """
+    Differentiates a dfn in a worker process (see _run).
+    """
+    return _run(apl, _session, **options)
+
+
 def main():
     import argparse
     import re
+    import subprocess
+    import sys
+    from contextlib import ExitStack
+    from functools import partial
 
-    from .autodiff import autodiff
+    from .autodiff import load_prim_grads, save_prim_grads
+    from .cache import DerivativeCache
+    from .profiling import profiling, write_report
+    from .transpile import Aplparse, Pyparse
+
+    if sys.argv[1:2] == ['serve']:
+        from .serve import main as serve
+        return serve(sys.argv[2:])
 
     parser = argparse.ArgumentParser(description='Differentiates a file of APL dfns and \
                                                   writes the derivatives to a new file.')
@@ -25,20 +102,161 @@ def main():
                         help='Path to APL file of dfns to differentiate.',
                         type=str)
     parser.add_argument('aplparse',
-                        help='Path to aplparse executable.',
-                        type=str)
+                        help='Path to aplparse executable, unless the built-in parser is used.',
+                        type=str,
+                        nargs='?')
+    parser.add_argument('--parser',
+                        help='Parse the dfns with aplparse or the built-in Python parser.',
+                        choices=['aplparse', 'python'],
+                        default='aplparse')
+    parser.add_argument('--jobs', '-j',
+                        help='Number of worker processes differentiating dfns in parallel.',
+                        type=int,
+                        default=1)
+    parser.add_argument('--no-cache',
+                        help='Neither read from nor write to the derivative cache.',
+                        action='store_true')
+    parser.add_argument('--no-cse',
+                        help='Keep common subexpressions in the derivatives, for debugging.',
+                        action='store_true')
+    parser.add_argument('--no-dce',
+                        help='Keep zero gradients and dead code in the derivatives, for debugging.',
+                        action='store_true')
+    parser.add_argument('--no-simplify',
+                        help='Keep the derivatives\' expressions unsimplified, for debugging.',
+                        action='store_true')
+    parser.add_argument('--batch',
+                        help='Differentiate over a leading batch axis of the argument, or, given \
+                              indices, of those items of the nested argument.',
+                        type=int,
+                        nargs='*',
+                        metavar='I')
+    parser.add_argument('--value-and-grad',
+                        help='Have the derivatives return the dfns\' outputs alongside the gradients.',
+                        action='store_true')
+    parser.add_argument('--checkpoint',
+                        help='Recompute intermediate results of the forward pass instead of \
+                              keeping them, except every ⌈√n⌉th one or, given names, those.',
+                        type=str,
+                        nargs='*',
+                        metavar='NAME')
+    parser.add_argument('--no-release',
+                        help='Keep variables in the derivatives alive until they return.',
+                        action='store_true')
+    parser.add_argument('--wrt',
+                        help='Indices of the items of the nested argument to differentiate \
+                              with respect to, by default all of them.',
+                        type=int,
+                        nargs='+',
+                        metavar='I')
+    parser.add_argument('--mode',
+                        help='Generate vector-Jacobian products (reverse), Jacobian-vector \
+                              products (forward), Hessian-vector products (hvp), or \
+                              stacked vector-Jacobian products (jacobian).',
+                        choices=['reverse', 'forward', 'hvp', 'jacobian'],
+                        default='reverse')
+    parser.add_argument('--profile',
+                        help='Write the time spent in each stage of differentiating each dfn, and \
+                              the size of its derivative, to a JSON (.json) or CSV file.',
+                        type=str,
+                        metavar='PATH')
+    parser.add_argument('--output', '-o',
+                        help='Write the derivatives to this file instead of one named after the \
+                              APL file with a d prefix.',
+                        type=str,
+                        metavar='PATH')
     args = parser.parse_args()
+    if args.parser == 'aplparse' and args.aplparse is None:
+        parser.error('the path to aplparse is required unless --parser python is passed')
+    session_cls = Aplparse if args.parser == 'aplparse' else Pyparse
+    options = {'cse': not args.no_cse, 'dce': not args.no_dce, 'simplify': not args.no_simplify,
+               'batch': False if args.batch is None else args.batch or True,
+               'value_and_grad': args.value_and_grad,
+               'checkpoint': False if args.checkpoint is None else args.checkpoint or True,
+               'release': not args.no_release,
+               'wrt': args.wrt,
+               'mode': args.mode}
 
-    res = []
     with open(args.apl, 'r') as f:
         # The regex pattern extracts dfns.
-        for apl in re.findall(r'\b\w+←\{[^{}]*\}', f.read()):
+        apls = re.findall(r'\b\w+←\{[^{}]*\}', f.read())
+
+    # Derivatives of dfns that haven't changed are read from the cache,
+    # and only the rest are parsed and differentiated.
+    cache = None if args.no_cache else DerivativeCache()
+    keys = [cache.key(apl, **options) for apl in apls] if cache is not None else [None] * len(apls)
+    cached = [cache.get(key) for key in keys] if cache is not None else [None] * len(apls)
+    todo = [apl for apl, dapl in zip(apls, cached) if dapl is None]
+
+    # The derivatives of primitives inlined into adjoints are persisted alongside.
+    if cache is not None and todo:
+        load_prim_grads(cache.path / 'prim_grads.json')
+
+    res = []
+    rows = []
+    with session_cls(args.aplparse) as session, ExitStack() as stack:
+        # All the dfns are parsed up front with a single parser launch,
+        # which is profiled on its own since it's shared by every dfn.
+        # Parsing errors are reported while differentiating the offending dfn.
+        with profiling() as profile:
+            try:
+                session.parse_many(todo)
+
+            except (subprocess.CalledProcessError, SyntaxError):
+                pass
+        rows.append({'dfn': '(parse all)', 'cached': False, 'profile': profile.as_dict()})
+
+        if args.jobs > 1 and len(todo) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            # Every worker has its own scratch space, and map preserves the input's
+            # order, so the output is identical to that of a sequential run.
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=args.jobs,
+                                                           initializer=_init_worker,
+                                                           initargs=(session_cls, args.aplparse, session.trees)))
+            derivatives = pool.map(partial(_differentiate, **options), todo)
+
+        else:
+            derivatives = (_run(apl, session, **options) for apl in todo)
+
+        for apl, key, dapl in zip(apls, keys, cached):
             print(f'Differentiating {apl.split("←")[0]}...')
-            res.append(autodiff(apl, args.aplparse))
-            print(f'Derivative successfully calculated.')
+            from_cache = dapl is not None
+            if not from_cache:
+                try:
+                    dapl, stats, profile = next(derivatives)
+
+                except (subprocess.CalledProcessError, SyntaxError) as e:
+                    print(f'Parsing failed: {e}')
+                    sys.exit(1)
+
+                except Exception as e:
+                    print(f'Failed to generate derivative: {e}')
+                    sys.exit(1)
+
+                if cache is not None:
+                    cache.put(key, dapl)
+                print(f'Derivative successfully calculated.')
+                if 'peak_live' in stats:
+                    print(f'Peak number of live arrays: {stats["peak_live"]}.')
+
+            else:
+                stats, profile = {}, {}
+                print(f'Derivative loaded from cache.')
+            res.append(dapl)
+            rows.append({'dfn': apl.split('←')[0], 'cached': from_cache,
+                         'derivative_chars': len(dapl), 'derivative_lines': dapl.count('\n')+1,
+                         **stats, 'profile': profile})
+
+    if cache is not None and todo:
+        save_prim_grads(cache.path / 'prim_grads.json')
+
+    if args.profile is not None:
+        write_report(rows, args.profile)
 
-    # A 'd' prefix is prepended to the original filename.
-    with open(re.sub(r'([^/]+)$', r'd\1', args.apl), 'w+') as f:
+    # Unless an output file is given, a 'd' prefix is prepended to the original filename.
+    output = args.output if args.output is not None else re.sub(r'([^/]+)$', r'd\1', args.apl)
+    with open(output, 'w+') as f:
         f.write('\n\n'.join(res))
 
 
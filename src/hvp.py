@@ -0,0 +1,130 @@
+"""
+Preparation of gradients for differentiation in forward mode, giving
+Hessian-vector products.
+
+The Hessian-vector product of a dfn with a scalar output is the Jacobian-vector
+product of its gradient, so the gradient generated in reverse mode is
+differentiated again in forward mode, without ever forming the Hessian. This
+costs a small multiple of a gradient evaluation. However, the gradient
+contains constructs Tangent can't differentiate:
+
+I) The output's derivative, which is an argument of the gradient, is fixed to 1.
+II) Selective assignments can't be broken up into separate calls, since the
+selection expression refers to the array being assigned into. They're
+replaced by calls to SelectiveAssignAt, which receives the selection expression
+as a string and whose tangent is itself (see prims_str in src/autodiff.py).
+III) Operands of operators in adjoints, such as TimesDy in JotDiaDyDy(TimesDy, ...),
+are renamed to the primitives' names, as in transpiled code, so their derivatives
+can be looked up.
+
+decode reverts II) once the gradient has been differentiated.
+"""
+
+
+import ast
+from typing import List
+
+import astor
+
+from .optimize import Substitute
+from .transpile.py_to_apl import OP_TO_GLYPH
+
+
+# Placeholder of the array assigned into in the selection expressions of
+# SelectiveAssignAt.
+BASE = '_base'
+
+
+def call_name(node: ast.AST) -> str:
+    return node.func.id if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) else ''
+
+
+def encode(dpy: ast.AST) -> ast.AST:
+    """
+    Prepares a Python gradient for differentiation in forward mode.
+
+    Args:
+        dpy: Python gradient, as a module or a function definition.
+
+    Returns:
+        The gradient, as a function of the argument alone, modified in place.
+
+    Raises:
+        RuntimeError: The gradient can't be differentiated.
+    """
+    func = dpy.body[0] if isinstance(dpy, ast.Module) else dpy
+    args = [arg.arg for arg in func.args.args]
+    dout = args[args.index('Omega')+1]
+    func.args.args = [arg for arg in func.args.args if arg.arg != dout]
+
+    for node in ast.walk(func):
+        # Derivatives of scalar rank operands are applied to the whole arguments
+        # (see AutodiffTransformer in src/autodiff.py), but those of others are
+        # inlined as APL dfns, and scans have no tangents, so neither can be differentiated.
+        if ((isinstance(node, ast.Call) and isinstance(node.func, ast.Call)) or
+            call_name(node).startswith('Backslash')):
+            raise RuntimeError('Hessian-vector products do not support the rank operator with '
+                               'non-scalar operands or reductions other than by addition, '
+                               'maximum, and minimum.')
+
+        if call_name(node) in OP_TO_GLYPH:
+            n_operands = 1 if call_name(node).startswith(tuple(op+'Mon' for op in OP_TO_GLYPH)) else 2
+            for operand in node.args[:n_operands]:
+                if isinstance(operand, ast.Name) and operand.id.endswith('Dy'):
+                    operand.id = operand.id[:-2]
+
+    body: List[ast.stmt] = []
+    for stmt in func.body:
+        stmt = Substitute(dout, ast.Constant(1)).visit(stmt)
+        if not (isinstance(stmt, ast.Assign) and call_name(stmt.value) == 'SelectiveAssign'):
+            body.append(stmt)
+            continue
+
+        # The array is assigned into, as in APL, and the target then refers to it.
+        target = stmt.targets[0].id
+        sel, val, base = stmt.value.args
+        sel = Substitute(base.id, ast.Name(id=BASE, ctx=ast.Load())).visit(sel)
+        body.append(ast.Assign(targets=[ast.Name(id=base.id, ctx=ast.Store())],
+                               value=ast.Call(func=ast.Name(id='SelectiveAssignAt', ctx=ast.Load()),
+                                              args=[ast.Constant(astor.to_source(sel).strip()),
+                                                    val,
+                                                    ast.Name(id=base.id, ctx=ast.Load())],
+                                              keywords=[])))
+        if target != base.id:
+            body.append(ast.Assign(targets=[ast.Name(id=target, ctx=ast.Store())],
+                                   value=ast.Name(id=base.id, ctx=ast.Load())))
+    func.body = body
+    return ast.fix_missing_locations(dpy)
+
+
+def decode(dpy: ast.AST) -> ast.AST:
+    """
+    Restores the selective assignments of a gradient prepared by encode,
+    after it's been differentiated.
+
+    Args:
+        dpy: Derivative of the prepared gradient, as a module or a function definition.
+
+    Returns:
+        The derivative, with selective assignments restored in place.
+    """
+    func = dpy.body[0] if isinstance(dpy, ast.Module) else dpy
+    body: List[ast.stmt] = []
+    for stmt in func.body:
+        if not (isinstance(stmt, ast.Assign) and call_name(stmt.value) == 'SelectiveAssignAt'):
+            body.append(stmt)
+            continue
+
+        # Tangent might assign the result to a variable other than the one
+        # assigned into, which then mustn't change, so the latter is copied first.
+        target = stmt.targets[0].id
+        src, val, base = stmt.value.args
+        if target != base.id:
+            body.append(ast.Assign(targets=[ast.Name(id=target, ctx=ast.Store())], value=base))
+        sel = Substitute(BASE, ast.Name(id=target, ctx=ast.Load())).visit(ast.parse(src.value, mode='eval').body)
+        body.append(ast.Assign(targets=[ast.Name(id=target, ctx=ast.Store())],
+                               value=ast.Call(func=ast.Name(id='SelectiveAssign', ctx=ast.Load()),
+                                              args=[sel, val, ast.Name(id=target, ctx=ast.Load())],
+                                              keywords=[])))
+    func.body = body
+    return ast.fix_missing_locations(dpy)
@@ -0,0 +1,924 @@
+"""
+Optimizations of the Python derivatives generated by Tangent, applied before
+they are transpiled back into APL.
+
+The derivatives are straight-line functions whose statements are assignments
+of primitive calls to variables, terminated by a return statement. Every
+primitive is pure, so two calls are equivalent if they apply the same
+function to equivalent arguments. The exception is SelectiveAssign, which
+modifies its third argument in place and is never touched (see
+src/transpile/py_to_apl.py).
+"""
+
+
+import ast
+import copy
+import itertools
+import re
+from typing import AbstractSet, Dict, Hashable, List, Optional, Sequence, Set, Tuple, Union
+
+
+class Versions:
+    """
+    Tracks the number of times each variable has been assigned while walking
+    through a function, so that two uses of a variable compare equal only if
+    no assignment has happened in between.
+    """
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+
+    def __getitem__(self, name: str) -> int:
+        return self.counts.get(name, 0)
+
+    def bump(self, stmt: ast.stmt) -> None:
+        """
+        Registers the assignments performed by a statement.
+        """
+        if not isinstance(stmt, ast.Assign):
+            return
+
+        for target in stmt.targets:
+            self.counts[target.id] = self[target.id]+1
+
+        # Selective assignment modifies its base in place.
+        if is_selective_assign(stmt.value):
+            base = stmt.value.args[2].id
+            self.counts[base] = self[base]+1
+
+
+def is_selective_assign(node: ast.AST) -> bool:
+    """
+    Checks if a node is a call to SelectiveAssign.
+    """
+    return (isinstance(node, ast.Call) and
+            isinstance(node.func, ast.Name) and
+            node.func.id == 'SelectiveAssign')
+
+
+def is_inline(node: ast.AST) -> bool:
+    """
+    Checks if a node is a call to Inline.
+    """
+    return (isinstance(node, ast.Call) and
+            isinstance(node.func, ast.Name) and
+            node.func.id == 'Inline')
+
+
+# Names in inlined APL code.
+APL_NAME = re.compile(r'(?<![\w¯.])[A-Za-z_∆⍙][A-Za-z_0-9∆⍙]*')
+# Names assigned within inlined code, which are local to its dfns.
+APL_LOCAL = re.compile(r'(?<![\w¯.])([A-Za-z_∆⍙][A-Za-z_0-9∆⍙]*)\s*←')
+
+
+def used_names(node: ast.AST) -> Set[str]:
+    """
+    Returns the names an expression reads, including those referred to by
+    inlined APL code, such as the selections of batched selective assignments
+    (see src/batch.py), but not the names inlined dfns assign to, which are
+    local to them, nor those of called functions, e.g., DotDyDy in
+    DotDyDy(Add, Times, x, y), which variables may share.
+    """
+    names = set()
+    funcs = {id(child.func) for child in ast.walk(node) if isinstance(child, ast.Call)}
+    for child in ast.walk(node):
+        if isinstance(child, ast.Name) and id(child) not in funcs:
+            names.add(child.id)
+        elif is_inline(child) and isinstance(child.args[0], ast.Constant):
+            code = child.args[0].value
+            names.update(set(APL_NAME.findall(code)) - set(APL_LOCAL.findall(code)))
+    return names
+
+
+def value_key(node: ast.AST, versions: Versions) -> Optional[Hashable]:
+    """
+    Computes a key identifying the value of an expression, or None if the
+    expression can't be reasoned about. Variables are identified by their
+    names and versions, so equal keys denote equal values.
+
+    Args:
+        node: Expression whose key is computed.
+        versions: Versions of the variables at the point of the expression.
+
+    Returns:
+        Key of the expression.
+    """
+    if isinstance(node, ast.Name):
+        return ('Name', node.id, versions[node.id])
+
+    if isinstance(node, ast.Constant):
+        return ('Constant', type(node.value), node.value)
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        operand = value_key(node.operand, versions)
+        return None if operand is None else ('USub', operand)
+
+    if not isinstance(node, ast.Call) or is_selective_assign(node):
+        return None
+
+    # Inlined code is opaque, and only inlined dfns are known not to refer
+    # to any variables.
+    if is_inline(node):
+        code = node.args[0].value
+        return ('Inline', code) if code.startswith('{') and code.endswith('}') else None
+
+    keys = [value_key(child, versions) for child in [node.func, *node.args]]
+    return None if None in keys or node.keywords else ('Call', *keys)
+
+
+def is_candidate(node: ast.AST) -> bool:
+    """
+    Checks if an expression is worth binding to a variable, that is, if it
+    is a call that evaluates to an array.
+    """
+    return isinstance(node, ast.Call) and not is_inline(node)
+
+
+def walk_values(node: ast.AST):
+    """
+    Yields the value positions of an expression, children before parents.
+    Selection expressions of selective assignments are skipped, since they are
+    assignment targets rather than values.
+    """
+    if is_selective_assign(node):
+        for arg in node.args[1:]:
+            yield from walk_values(arg)
+
+    elif isinstance(node, ast.Call):
+        for child in [node.func, *node.args]:
+            yield from walk_values(child)
+
+    elif isinstance(node, (ast.UnaryOp, ast.Tuple)):
+        for child in ast.iter_child_nodes(node):
+            yield from walk_values(child)
+
+    yield node
+
+
+def fresh_names(func: ast.FunctionDef, prefix: str):
+    """
+    Generates variable names that don't clash with those used by a function.
+    """
+    taken = {node.id for node in ast.walk(func) if isinstance(node, ast.Name)}
+    return (name for name in map(f'{prefix}{{}}'.format, itertools.count())
+            if name not in taken)
+
+
+class CSE:
+    """
+    Eliminates common subexpressions from a function. Each expression that
+    is computed more than once is bound to a variable the first time, and
+    that variable is reused subsequently. If the expression is the entire
+    value of an assignment, its target serves as the variable; otherwise,
+    a new temporary variable is introduced right before the statement.
+
+    Nested repetitions are handled by running the pass until it reaches a
+    fixpoint, with temporaries that turn out to be used once inlined back.
+    """
+    def __init__(self, func: ast.FunctionDef):
+        self.func = func
+        self.names = fresh_names(func, '_cse')
+
+    def count(self) -> Dict[Hashable, int]:
+        """
+        Counts the occurrences of every candidate expression.
+        """
+        counts: Dict[Hashable, int] = {}
+        versions = Versions()
+        for stmt in self.func.body:
+            for node in walk_values(stmt.value):
+                key = value_key(node, versions)
+                if key is not None and is_candidate(node):
+                    counts[key] = counts.get(key, 0)+1
+            versions.bump(stmt)
+        return counts
+
+    def rewrite(self, node: ast.AST, top: bool) -> ast.AST:
+        """
+        Rewrites an expression in place, replacing the subexpressions that are
+        already available with their variables.
+
+        Args:
+            node: Expression to rewrite.
+            top: Flag indicating the expression is the entire value of an
+                assignment to a single variable.
+
+        Returns:
+            The rewritten expression.
+        """
+        if is_selective_assign(node):
+            node.args[1:] = [self.rewrite(arg, False) for arg in node.args[1:]]
+            return node
+
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name):
+                node.func = self.rewrite(node.func, False)
+            node.args = [self.rewrite(arg, False) for arg in node.args]
+
+        elif isinstance(node, ast.UnaryOp):
+            node.operand = self.rewrite(node.operand, False)
+
+        elif isinstance(node, ast.Tuple):
+            node.elts = [self.rewrite(elt, False) for elt in node.elts]
+
+        key = value_key(node, self.versions)
+        if key is None or not is_candidate(node):
+            return node
+
+        self.remaining[key] = self.remaining.get(key, 0)-1
+        name = self.available.get(key)
+        if name is not None and self.versions[name[0]] == name[1]:
+            self.changed = True
+            return ast.Name(id=name[0], ctx=ast.Load())
+
+        # Expressions that aren't computed again are left as they are.
+        if self.remaining[key] < 1:
+            return node
+
+        if top:
+            self.pending = key
+            return node
+
+        temp = next(self.names)
+        assign = ast.Assign(targets=[ast.Name(id=temp, ctx=ast.Store())], value=node)
+        self.prelude.append(assign)
+        self.versions.bump(assign)
+        self.available[key] = (temp, self.versions[temp])
+        self.changed = True
+        return ast.Name(id=temp, ctx=ast.Load())
+
+    def step(self) -> bool:
+        """
+        Runs a single pass of elimination over the function.
+
+        Returns:
+            Flag indicating whether the function was modified.
+        """
+        self.remaining = self.count()
+        self.available: Dict[Hashable, Tuple[str, int]] = {}
+        self.versions = Versions()
+        self.changed = False
+
+        body: List[ast.stmt] = []
+        for stmt in self.func.body:
+            self.prelude: List[ast.stmt] = []
+            self.pending = None
+            top = (isinstance(stmt, ast.Assign) and
+                   len(stmt.targets) == 1 and
+                   isinstance(stmt.targets[0], ast.Name))
+            stmt.value = self.rewrite(stmt.value, top)
+
+            self.versions.bump(stmt)
+            if self.pending is not None:
+                target = stmt.targets[0].id
+                self.available[self.pending] = (target, self.versions[target])
+
+            body.extend(self.prelude)
+            body.append(stmt)
+
+        self.func.body = body
+        return self.changed
+
+    def inline_single_uses(self) -> None:
+        """
+        Substitutes temporaries that are used only once back into their use,
+        provided none of the variables they depend on has been reassigned in between.
+        """
+        uses: Dict[str, int] = {}
+        for node in ast.walk(self.func):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+                uses[node.id] = uses.get(node.id, 0)+1
+
+        temps: Dict[str, Tuple[ast.AST, Dict[str, int]]] = {}
+        inlined = set()
+        versions = Versions()
+
+        def substitute(node: ast.AST) -> ast.AST:
+            if isinstance(node, ast.Name) and node.id in temps:
+                value, deps = temps.pop(node.id)
+                if all(versions[dep] == version for dep, version in deps.items()):
+                    inlined.add(node.id)
+                    return value
+                return node
+
+            for field, child in ast.iter_fields(node):
+                if isinstance(child, ast.AST):
+                    setattr(node, field, substitute(child))
+                elif isinstance(child, list):
+                    setattr(node, field, [substitute(elt) if isinstance(elt, ast.AST) else elt
+                                          for elt in child])
+            return node
+
+        for stmt in self.func.body:
+            stmt.value = substitute(stmt.value)
+            name = stmt.targets[0].id if isinstance(stmt, ast.Assign) else ''
+            if name.startswith('_cse') and uses.get(name) == 1:
+                temps[name] = (stmt.value,
+                               {node.id: versions[node.id]
+                                for node in ast.walk(stmt.value) if isinstance(node, ast.Name)})
+            versions.bump(stmt)
+
+        self.func.body = [stmt for stmt in self.func.body
+                          if not (isinstance(stmt, ast.Assign) and stmt.targets[0].id in inlined)]
+
+    def run(self) -> None:
+        while self.step():
+            pass
+        self.inline_single_uses()
+
+
+def cse(py: ast.AST) -> ast.AST:
+    """
+    Eliminates common subexpressions from a Python function of APL primitives.
+
+    Args:
+        py: Python function, as a module or a function definition.
+
+    Returns:
+        The function, optimized in place.
+    """
+    func = py.body[0] if isinstance(py, ast.Module) else py
+    CSE(func).run()
+    return py
+
+
+class ZeroFolding:
+    """
+    Tracks the variables known to be zero, namely, those initialized by TimesDy(0, x),
+    and folds the arithmetic they take part in. Additions of zeros to gradients are
+    dropped, products with zeros are replaced by the zeros, and selectively assigning
+    zero to a zero array leaves the array as is.
+
+    Tangent's gradients of a variable all share its shape, so folding additions never
+    changes the shape of the result. Products, however, extend scalars, so they're
+    only replaced by their zero if the other operand is a literal or has the same
+    shape, i.e., is the variable the zero was initialized from, or another zero
+    initialized from it.
+    """
+    def __init__(self, func: ast.FunctionDef):
+        self.func = func
+        self.versions = Versions()
+        self.zeros: Dict[str, int] = {}
+        # Variables, with their versions, that zeros are known to be shaped like.
+        self.shapes: Dict[str, Tuple[str, int]] = {}
+
+    def is_zero(self, node: ast.AST) -> bool:
+        if isinstance(node, ast.Constant):
+            return node.value == 0
+
+        return (isinstance(node, ast.Name) and
+                self.zeros.get(node.id) == self.versions[node.id])
+
+    def shape(self, node: ast.AST) -> Optional[Tuple[str, int]]:
+        """
+        Identifies the shape of an expression by a variable it's known to be
+        shaped like, or returns None if there's none.
+        """
+        if not isinstance(node, ast.Name):
+            return None
+
+        if self.is_zero(node):
+            return self.shapes.get(node.id)
+
+        return node.id, self.versions[node.id]
+
+    def fold(self, node: ast.AST) -> ast.AST:
+        """
+        Folds the value of an assignment.
+        """
+        if not isinstance(node, ast.Call) or not isinstance(node.func, ast.Name):
+            return node
+
+        if node.func.id == 'AddDy' and all(isinstance(arg, ast.Name) for arg in node.args):
+            left, right = node.args
+            return left if self.is_zero(right) else right if self.is_zero(left) else node
+
+        if node.func.id == 'TimesDy':
+            for zero, other in [node.args, node.args[::-1]]:
+                if (isinstance(zero, ast.Name) and self.is_zero(zero) and
+                    (literal(other) is not None or
+                     self.shape(other) is not None and self.shape(other) == self.shape(zero))):
+                    return zero
+            return node
+
+        if node.func.id == 'Sub' and isinstance(node.args[0], ast.Name):
+            return node.args[0] if self.is_zero(node.args[0]) else node
+
+        if is_selective_assign(node):
+            _, val, base = node.args
+            return base if self.is_zero(val) and self.is_zero(base) else node
+
+        return node
+
+    def run(self) -> None:
+        body = []
+        for stmt in self.func.body:
+            if isinstance(stmt, ast.Assign) and isinstance(stmt.targets[0], ast.Name):
+                stmt.value = self.fold(stmt.value)
+                target = stmt.targets[0].id
+
+                # The assignment is a no-op.
+                if isinstance(stmt.value, ast.Name) and stmt.value.id == target:
+                    continue
+
+                zero = (self.is_zero(stmt.value) or
+                        (isinstance(stmt.value, ast.Call) and
+                         isinstance(stmt.value.func, ast.Name) and
+                         stmt.value.func.id == 'TimesDy' and
+                         any(map(self.is_zero, stmt.value.args))))
+                # Zeros are shaped like the variable they're initialized from, or
+                # like the zero they copy.
+                if not zero:
+                    shape = None
+                elif isinstance(stmt.value, ast.Name):
+                    shape = self.shapes.get(stmt.value.id)
+                else:
+                    left, right = stmt.value.args
+                    shape = (self.shape(right) if literal(left) == 0 else
+                             self.shape(left) if literal(right) == 0 else None)
+                self.versions.bump(stmt)
+                if zero:
+                    self.zeros[target] = self.versions[target]
+                    if shape is None:
+                        self.shapes.pop(target, None)
+                    else:
+                        self.shapes[target] = shape
+
+            body.append(stmt)
+        self.func.body = body
+
+
+def eliminate_dead_code(func: ast.FunctionDef) -> None:
+    """
+    Removes the assignments whose results never reach the return value of a function.
+
+    Args:
+        func: Function definition, modified in place.
+    """
+    live = set()
+    body = []
+    for stmt in reversed(func.body):
+        if isinstance(stmt, ast.Assign):
+            defined = [target.id for target in stmt.targets]
+            # Selective assignment modifies its base in place.
+            if is_selective_assign(stmt.value):
+                defined.append(stmt.value.args[2].id)
+
+            if live.isdisjoint(defined):
+                continue
+            live.difference_update(target.id for target in stmt.targets)
+
+        live.update(used_names(stmt.value))
+        body.append(stmt)
+    func.body = body[::-1]
+
+
+def dce(py: ast.AST) -> ast.AST:
+    """
+    Folds arithmetic involving known zeros and eliminates dead code from a Python
+    function of APL primitives.
+
+    Args:
+        py: Python function, as a module or a function definition.
+
+    Returns:
+        The function, optimized in place.
+    """
+    func = py.body[0] if isinstance(py, ast.Module) else py
+    ZeroFolding(func).run()
+    eliminate_dead_code(func)
+    return py
+
+
+def literal(node: ast.AST) -> Optional[float]:
+    """
+    Returns the number a node denotes, or None if it isn't a numeric literal.
+    """
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        value = literal(node.operand)
+        return None if value is None else -value
+
+    if (isinstance(node, ast.Constant) and
+        isinstance(node.value, (int, float)) and
+        not isinstance(node.value, bool)):
+        return node.value
+
+    return None
+
+
+def to_literal(value: float) -> Optional[ast.AST]:
+    """
+    Creates a numeric literal, or returns None if the number can't be
+    written as one in APL.
+    """
+    if isinstance(value, float):
+        if value != value or value in (float('inf'), float('-inf')) or 'e' in repr(value):
+            return None
+        if value.is_integer():
+            value = int(value)
+
+    if value < 0:
+        return ast.UnaryOp(op=ast.USub(), operand=ast.Constant(-value))
+    return ast.Constant(value)
+
+
+# Scalar functions whose values on literals are computed at differentiation time.
+# Arguments APL treats differently from Python, such as zero divisors and
+# non-boolean arguments to not, are left alone.
+FOLDS = {
+    'AddDy': lambda a, b: a+b,
+    'SubDy': lambda a, b: a-b,
+    'TimesDy': lambda a, b: a*b,
+    'DivDy': lambda a, b: a/b if b != 0 else None,
+    'PowDy': lambda a, b: a**b if a > 0 or float(b).is_integer() and (a != 0 or b >= 0) else None,
+    'MaxDy': max,
+    'MinDy': min,
+    'Sub': lambda a: -a,
+    'Times': lambda a: (a > 0)-(a < 0),
+    'Div': lambda a: 1/a if a != 0 else None,
+    'Tilde': lambda a: 1-a if a in (0, 1) else None,
+}
+
+# Identity elements, as (function, index of the identity, identity), which
+# leave the other argument unchanged.
+IDENTITIES = [
+    ('AddDy', 0, 0),
+    ('AddDy', 1, 0),
+    ('SubDy', 1, 0),
+    ('TimesDy', 0, 1),
+    ('TimesDy', 1, 1),
+    ('DivDy', 1, 1),
+    ('PowDy', 1, 1),
+]
+
+
+class Simplifier:
+    """
+    Simplifies the expressions of a function with rewrite rules. Literal arithmetic
+    is folded, variables assigned literals are substituted by them, and applications
+    of functions to their identity elements, such as multiplications by 1 and
+    additions of 0, are replaced by the other argument. Rules that would change
+    the shape of the result, such as multiplications by 0, are not applied.
+    """
+    def __init__(self, func: ast.FunctionDef):
+        self.func = func
+        self.versions = Versions()
+        self.consts: Dict[str, Tuple[int, ast.AST]] = {}
+
+    def simplify(self, node: ast.AST) -> ast.AST:
+        if isinstance(node, ast.Name):
+            const = self.consts.get(node.id)
+            if const is not None and const[0] == self.versions[node.id]:
+                return to_literal(literal(const[1]))
+            return node
+
+        if not isinstance(node, ast.Call):
+            return node
+
+        # The base of selective assignment must remain a variable.
+        if is_selective_assign(node):
+            node.args[:2] = [self.simplify(arg) for arg in node.args[:2]]
+            return node
+
+        if not isinstance(node.func, ast.Name):
+            node.func = self.simplify(node.func)
+        node.args = [self.simplify(arg) for arg in node.args]
+        if not isinstance(node.func, ast.Name):
+            return node
+        name = node.func.id
+
+        values = [literal(arg) for arg in node.args]
+        if name in FOLDS and None not in values:
+            try:
+                folded = FOLDS[name](*values)
+
+            except (ArithmeticError, ValueError):
+                folded = None
+
+            folded = None if folded is None or isinstance(folded, complex) else to_literal(folded)
+            if folded is not None:
+                return folded
+
+        for func, idx, identity in IDENTITIES:
+            if name == func and len(node.args) == 2 and values[idx] == identity:
+                return node.args[1-idx]
+
+        return node
+
+    def run(self) -> None:
+        for stmt in self.func.body:
+            stmt.value = self.simplify(stmt.value)
+            self.versions.bump(stmt)
+            if isinstance(stmt, ast.Assign) and literal(stmt.value) is not None:
+                target = stmt.targets[0].id
+                self.consts[target] = (self.versions[target], stmt.value)
+
+
+def simplify(py: ast.AST) -> ast.AST:
+    """
+    Simplifies the expressions of a Python function of APL primitives.
+
+    Args:
+        py: Python function, as a module or a function definition.
+
+    Returns:
+        The function, optimized in place.
+    """
+    func = py.body[0] if isinstance(py, ast.Module) else py
+    Simplifier(func).run()
+    return py
+
+
+class Substitute(ast.NodeTransformer):
+    """
+    Renames a variable within an expression, or replaces it with a copy of
+    another expression.
+    """
+    def __init__(self, old: str, new: Union[str, ast.AST]):
+        self.old = old
+        self.new = new
+
+    def visit_Name(self, node):
+        if node.id != self.old:
+            return node
+        if isinstance(self.new, str):
+            return ast.Name(id=self.new, ctx=node.ctx)
+        return copy.deepcopy(self.new)
+
+
+def fuse_selections(py: ast.AST) -> ast.AST:
+    """
+    Accumulates the derivatives of selections, such as picks, directly into the
+    gradient of the argument they're selected from. Adjoints of selections
+    selectively assign the derivative into zeros shaped like the argument, which
+    Tangent then adds to the argument's gradient, i.e.,
+
+        zeros = TimesDy(0, x)
+        t = SelectiveAssign(Sel(zeros), g, zeros)
+        acc = AddDy(acc, t)
+
+    These three statements are fused into the selective addition of g
+    to the selected part of the gradient,
+
+        acc = SelectiveAssign(Sel(acc), AddDy(Sel(acc), g), acc)
+
+    so memory scales with the size of the selection rather than that of x.
+
+    Args:
+        py: Python function, as a module or a function definition.
+
+    Returns:
+        The function, optimized in place.
+    """
+    func = py.body[0] if isinstance(py, ast.Module) else py
+
+    # Variables such as zeros are reassigned by every adjoint, so uses are counted
+    # per assignment, identified by the variable's name and version.
+    uses: Dict[Tuple[str, int], int] = {}
+    defs: Dict[int, int] = {}
+    versions = Versions()
+    for stmt in func.body:
+        for node in ast.walk(stmt.value):
+            if isinstance(node, ast.Name):
+                key = (node.id, versions[node.id])
+                uses[key] = uses.get(key, 0)+1
+        versions.bump(stmt)
+        if isinstance(stmt, ast.Assign):
+            defs[id(stmt)] = versions[stmt.targets[0].id]
+
+    def target(stmt: ast.stmt) -> Optional[str]:
+        return (stmt.targets[0].id if isinstance(stmt, ast.Assign) and len(stmt.targets) == 1
+                else None)
+
+    body: List[ast.stmt] = []
+    for stmt in func.body:
+        body.append(stmt)
+        if len(body) < 3:
+            continue
+
+        init, select, add = body[-3:]
+        zeros, t, acc = target(init), target(select), target(add)
+        if (None in (zeros, t, acc) or
+            not (isinstance(init.value, ast.Call) and
+                 isinstance(init.value.func, ast.Name) and
+                 init.value.func.id == 'TimesDy' and
+                 literal(init.value.args[0]) == 0) or
+            not is_selective_assign(select.value) or
+            not (isinstance(select.value.args[2], ast.Name) and select.value.args[2].id == zeros) or
+            not (isinstance(add.value, ast.Call) and
+                 isinstance(add.value.func, ast.Name) and
+                 add.value.func.id == 'AddDy')):
+            continue
+
+        # The accumulated derivatives are acc and t, in either order.
+        args = [arg.id if isinstance(arg, ast.Name) else None for arg in add.value.args]
+        if sorted(args, key=str) != sorted([acc, t], key=str) or acc == t:
+            continue
+
+        # The zeros and selected derivative mustn't be used anywhere else.
+        sel, g, _ = select.value.args
+        n_zeros = sum(isinstance(node, ast.Name) and node.id == zeros for node in ast.walk(sel))
+        version = defs.get(id(init))
+        if (uses.get((zeros, version)) != n_zeros+1 or
+            uses.get((zeros, version+1 if version is not None else None)) or
+            uses.get((t, defs.get(id(select)))) != 1 or
+            zeros in (acc, t)):
+            continue
+        if any(isinstance(node, ast.Name) and node.id == acc for node in ast.walk(g)):
+            continue
+
+        acc_sel = lambda: Substitute(zeros, acc).visit(copy.deepcopy(sel))
+        fused = ast.Call(func=ast.Name(id='SelectiveAssign', ctx=ast.Load()),
+                         args=[acc_sel(),
+                               ast.Call(func=ast.Name(id='AddDy', ctx=ast.Load()),
+                                        args=[acc_sel(), g],
+                                        keywords=[]),
+                               ast.Name(id=acc, ctx=ast.Load())],
+                         keywords=[])
+        body[-3:] = [ast.Assign(targets=[ast.Name(id=acc, ctx=ast.Store())], value=fused)]
+
+    func.body = body
+    return py
+
+
+def is_small(node: ast.AST, small: AbstractSet[str]) -> bool:
+    """
+    Checks if an expression evaluates to a small array, namely, a literal or a
+    function of shapes and tallies, e.g., ×/¯1↓⍴x.
+
+    Args:
+        node: Expression to check.
+        small: Names of the variables known to be small, along with those of functions.
+    """
+    if isinstance(node, ast.Name):
+        return node.id in small
+
+    if isinstance(node, (ast.Constant, ast.UnaryOp)):
+        return True
+
+    if not isinstance(node, ast.Call):
+        return False
+
+    if isinstance(node.func, ast.Name) and node.func.id in ('Rho', 'Nmatch', 'Inline'):
+        return True
+
+    return all(is_small(child, small) for child in [node.func, *node.args])
+
+
+def is_release(stmt: ast.stmt) -> bool:
+    """
+    Checks if a statement releases variables by assigning them ⍬.
+    """
+    return (isinstance(stmt, ast.Assign) and
+            is_inline(stmt.value) and
+            stmt.value.args[0].value == '⍬')
+
+
+def release_dead(py: ast.AST, stats: Optional[Dict] = None) -> ast.AST:
+    """
+    Releases the memory held by variables once they are no longer needed, by assigning
+    them ⍬ right after their last use, so that the peak workspace of the function
+    is close to its live set. Small arrays, like shapes, aren't worth releasing.
+    Copies share their source's memory, so a source that dies when it's copied
+    is released once the copy's value ends instead, unless the copy is assigned
+    into selectively.
+
+    Args:
+        py: Python function, as a module or a function definition.
+        stats: Dictionary to record the peak number of simultaneously
+            live variables in, under 'peak_live'.
+
+    Returns:
+        The function, optimized in place.
+    """
+    func = py.body[0] if isinstance(py, ast.Module) else py
+    # Existing releases, such as those of checkpointing, are superseded.
+    func.body = [stmt for stmt in func.body if not is_release(stmt)]
+    args = {arg.arg for arg in func.args.args}
+    variables = args | {target.id for stmt in func.body if isinstance(stmt, ast.Assign)
+                        for target in stmt.targets}
+
+    # Variables are small if every assignment to them is small, and
+    # names other than those of variables are those of functions.
+    functions = {node.id for node in ast.walk(func)
+                 if isinstance(node, ast.Name) and node.id not in variables}
+    small = variables-args
+    changed = True
+    while changed:
+        changed = False
+        for stmt in func.body:
+            if (isinstance(stmt, ast.Assign) and
+                not is_small(stmt.value, small | functions) and
+                any(target.id in small for target in stmt.targets)):
+                small -= {target.id for target in stmt.targets}
+                changed = True
+
+    live: Set[str] = set()
+    peak = 0
+    body: List[ast.stmt] = []
+    # The releases following the ends of the variables' current values, i.e.,
+    # their last uses before they die or are redefined, and the variables
+    # that are assigned into selectively before they are redefined.
+    ends: Dict[str, ast.Assign] = {}
+    in_place: Set[str] = set()
+    for stmt in reversed(func.body):
+        used = used_names(stmt.value) & variables
+        defined = ({target.id for target in stmt.targets}
+                   if isinstance(stmt, ast.Assign) else set())
+
+        dying = (used | defined) - live - args - small
+        # A source copied into a variable is released when the copy's value ends,
+        # or never if it doesn't, unless the copy is assigned into selectively,
+        # in which case releasing the source spares the copy on write.
+        if (isinstance(stmt, ast.Assign) and isinstance(stmt.value, ast.Name) and
+            stmt.value.id in dying and stmt.targets[0].id not in dying and
+            stmt.targets[0].id not in in_place):
+            dying.discard(stmt.value.id)
+            copy_end = ends.get(stmt.targets[0].id)
+            if copy_end is not None:
+                copy_end.targets.append(ast.Name(id=stmt.value.id, ctx=ast.Store()))
+                ends[stmt.value.id] = copy_end
+
+        # Selective assignments modify their bases in place rather than redefine them.
+        if is_selective_assign(stmt.value):
+            in_place.add(stmt.value.args[2].id)
+            defined = defined - {stmt.value.args[2].id}
+        ended = dying | (used & defined)
+        if ended and isinstance(stmt, ast.Assign) and not is_release(stmt):
+            release = ast.Assign(targets=[ast.Name(id=name, ctx=ast.Store()) for name in sorted(dying)],
+                                 value=ast.Call(func=ast.Name(id='Inline', ctx=ast.Load()),
+                                                args=[ast.Constant('⍬')],
+                                                keywords=[]))
+            ends.update(dict.fromkeys(ended, release))
+            body.append(release)
+        body.append(stmt)
+
+        in_place -= defined
+        live = (live - defined) | used
+        peak = max(peak, len(live | defined))
+
+    # Ends of values that no copied source was released at need no release.
+    body = [stmt for stmt in body if not (is_release(stmt) and not stmt.targets)]
+    func.body = body[::-1]
+    if stats is not None:
+        stats['peak_live'] = peak
+    return py
+
+
+def prune_inactive(py: ast.AST, wrt: Sequence[int]) -> ast.AST:
+    """
+    Differentiates a function only with respect to some items of its nested
+    argument, by pruning the code computing the gradients of the others. The
+    gradient of the argument is assembled by selectively assigning the gradients of
+    picks from it into zeros shaped like it, so the assignments into inactive items
+    are dropped, and so is whatever code only they depended on. The gradients of
+    inactive items are left as zeros.
+
+    Args:
+        py: Python derivative, as a module or a function definition.
+        wrt: 1-based indices of the active items of the argument.
+
+    Returns:
+        The derivative, optimized in place.
+    """
+    func = py.body[0] if isinstance(py, ast.Module) else py
+
+    def is_container(node: ast.AST) -> bool:
+        if isinstance(node, ast.Name):
+            return node.id in containers
+        if not isinstance(node, ast.Call) or not isinstance(node.func, ast.Name):
+            return False
+        if node.func.id == 'TimesDy':
+            return (literal(node.args[0]) == 0 and
+                    isinstance(node.args[1], ast.Name) and
+                    node.args[1].id == 'Omega')
+        if node.func.id == 'AddDy':
+            return all(map(is_container, node.args))
+        return is_selective_assign(node) and is_container(node.args[2])
+
+    # Containers are the variables holding gradients of the argument.
+    containers: Set[str] = set()
+    body: List[ast.stmt] = []
+    for stmt in func.body:
+        if isinstance(stmt, ast.Assign) and is_selective_assign(stmt.value):
+            sel, _, base = stmt.value.args
+            if is_container(base) and isinstance(sel, ast.Call) and isinstance(sel.func, ast.Name):
+                pick = (literal(sel.args[0]) if sel.func.id == 'DiscloseDy' else
+                        1 if sel.func.id == 'Disclose' else None)
+                if pick is not None and pick not in wrt:
+                    stmt = ast.Assign(targets=stmt.targets, value=base)
+
+        if isinstance(stmt, ast.Assign):
+            targets = {target.id for target in stmt.targets}
+            if is_container(stmt.value):
+                containers |= targets
+            else:
+                containers -= targets
+
+            # The assignment is a no-op.
+            if isinstance(stmt.value, ast.Name) and targets == {stmt.value.id}:
+                continue
+        body.append(stmt)
+
+    func.body = body
+    eliminate_dead_code(func)
+    return py
@@ -0,0 +1,143 @@
+"""
+Instrumentation of the stages of differentiation.
+
+Every stage of the pipeline, from parsing to transpiling the derivative back
+into APL, is timed with stage, and noteworthy events, like launches of
+aplparse, are counted with count. The timings and counts are recorded in the
+profile activated by profiling, if any, which is local to the current thread
+or task, and timings are additionally passed to the hooks registered with
+add_hook. Stages may nest, e.g., the derivatives of primitives generated by
+Tangent are timed within the inlining of derivatives that requests them, and
+a stage that runs several times accumulates its timings.
+"""
+
+
+import csv
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Union
+
+
+# Callback receiving the name of a stage and its duration in seconds.
+Hook = Callable[[str, float], None]
+
+_hooks: List[Hook] = []
+
+
+class Profile:
+    """
+    Timings, in seconds, and counts of the stages of differentiation.
+    """
+    def __init__(self) -> None:
+        self.timings: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+
+    def as_dict(self) -> Dict[str, Dict]:
+        """
+        Returns the profile as a dictionary, with timings in milliseconds.
+        """
+        return {'timings_ms': {stage: 1000*secs for stage, secs in self.timings.items()},
+                'counts': dict(self.counts)}
+
+
+_profile: ContextVar[Optional[Profile]] = ContextVar('profile', default=None)
+
+
+@contextmanager
+def profiling() -> Iterator[Profile]:
+    """
+    Records the stages run within the context in a new profile.
+
+    Yields:
+        The profile.
+    """
+    profile = Profile()
+    token = _profile.set(profile)
+    try:
+        yield profile
+
+    finally:
+        _profile.reset(token)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Times a stage of differentiation.
+
+    Args:
+        name: Name of the stage.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+
+    finally:
+        elapsed = time.perf_counter()-start
+        profile = _profile.get()
+        if profile is not None:
+            profile.timings[name] = profile.timings.get(name, 0.0)+elapsed
+        for hook in list(_hooks):
+            hook(name, elapsed)
+
+
+def count(name: str, n: int = 1) -> None:
+    """
+    Counts an event in the active profile, if any.
+
+    Args:
+        name: Name of the event.
+        n: Number of occurrences.
+    """
+    profile = _profile.get()
+    if profile is not None:
+        profile.counts[name] = profile.counts.get(name, 0)+n
+
+
+def add_hook(hook: Hook) -> None:
+    """
+    Registers a callback invoked with the name and duration in seconds of
+    every stage that finishes, in any thread.
+    """
+    _hooks.append(hook)
+
+
+def remove_hook(hook: Hook) -> None:
+    """
+    Unregisters a callback registered with add_hook.
+    """
+    _hooks.remove(hook)
+
+
+def write_report(rows: List[Dict], path: Union[str, Path]) -> None:
+    """
+    Writes per-dfn profiles as JSON, if the path ends with .json, or CSV otherwise.
+
+    Args:
+        rows: Records of the dfns, each with the dfn's name under 'dfn' and,
+            optionally, a profile under 'profile' (see Profile.as_dict) and
+            other flat fields.
+        path: Path of the report.
+    """
+    path = Path(path)
+    if path.suffix == '.json':
+        path.write_text(json.dumps(rows, ensure_ascii=False, indent=2), encoding='utf-8')
+        return
+
+    # Timings and counts are flattened into columns, e.g., tangent_ms.
+    flat_rows = []
+    for row in rows:
+        flat = {key: val for key, val in row.items() if key != 'profile'}
+        profile = row.get('profile', {})
+        flat.update({f'{stage}_ms': round(ms, 3) for stage, ms in profile.get('timings_ms', {}).items()})
+        flat.update(profile.get('counts', {}))
+        flat_rows.append(flat)
+
+    fields = list(dict.fromkeys(field for row in flat_rows for field in row))
+    with path.open('w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(flat_rows)
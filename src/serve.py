@@ -0,0 +1,217 @@
+"""
+Long-running differentiation server.
+
+ada serve keeps Tangent, the primitives and their adjoints, and the parser
+loaded, and differentiates dfns on request, sparing editor integrations and
+build systems the start-up cost of a run of ada per file. Requests and
+responses are JSON objects, one per line, read from stdin and written to
+stdout, or exchanged over a Unix socket, which any number of clients may
+connect to at once. Dfns are differentiated one at a time, however, since
+Tangent isn't thread-safe.
+
+A request comprises the dfn and, optionally, an ID that's echoed back and
+options of autodiff (see src/autodiff.py), e.g.:
+    {"id": 1, "dfn": "f←{+/⍵×⍵}", "options": {"mode": "forward"}}
+
+The response comprises either the derivative and its statistics:
+    {"id": 1, "ok": true, "derivative": "dfdOmega←{...}", "stats": {"peak_live": 2}}
+or the type and message of the error:
+    {"id": 1, "ok": false, "error": {"type": "SyntaxError", "message": "..."}}
+
+Usage:
+    ada serve [aplparse] [--parser {aplparse,python}] [--socket PATH] [--no-cache]
+
+Args:
+    aplparse: Path to aplparse executable, unless the built-in parser is used.
+    parser: Parser of the dfns, either aplparse or the built-in Python parser.
+    socket: Path of the Unix socket to listen on instead of stdin and stdout.
+    no-cache: Flag to neither read from nor write to the derivative cache.
+"""
+
+
+import io
+import json
+import os
+import socketserver
+import sys
+import threading
+from inspect import signature
+from typing import Any, Dict, List, Optional
+
+from .autodiff import autodiff, load_prim_grads, load_prims, save_prim_grads
+from .cache import DerivativeCache
+from .transpile import Aplparse
+
+
+# Options requests may pass to autodiff.
+OPTIONS = ('cse', 'dce', 'simplify', 'batch', 'value_and_grad', 'checkpoint', 'release', 'wrt', 'mode')
+
+
+class Server:
+    """
+    Differentiates dfns on request, sharing a parsing session and a derivative
+    cache across requests.
+
+    Args:
+        session: Parsing session, of aplparse or the built-in parser.
+        cache: Derivative cache, or None to not cache derivatives.
+    """
+    def __init__(self, session: Aplparse, cache: Optional[DerivativeCache] = None):
+        self.session = session
+        self.cache = cache
+        self.lock = threading.Lock()
+        # Omitted options are filled in so that they're part of cache keys
+        # just as those of the command-line tool are.
+        self.defaults = {name: param.default for name, param in signature(autodiff).parameters.items()
+                         if name in OPTIONS}
+
+    def respond(self, request: Any) -> Dict:
+        """
+        Differentiates the dfn of a request.
+
+        Args:
+            request: Decoded request.
+
+        Returns:
+            Response to the request.
+        """
+        req_id = request.get('id') if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict) or not isinstance(request.get('dfn'), str):
+                raise ValueError('Requests must be objects with a dfn.')
+
+            options = request.get('options', {})
+            if not isinstance(options, dict):
+                raise ValueError('Options must be an object.')
+            unknown = set(options) - set(OPTIONS)
+            if unknown:
+                raise ValueError(f'Unknown options: {", ".join(sorted(unknown))}.')
+            options = {**self.defaults, **options}
+
+            with self.lock:
+                key = self.cache.key(request['dfn'], **options) if self.cache is not None else None
+                dapl = self.cache.get(key) if self.cache is not None else None
+                stats: Dict = {}
+                if dapl is None:
+                    dapl = autodiff(request['dfn'], self.session, stats=stats, **options)
+                    if self.cache is not None:
+                        self.cache.put(key, dapl)
+
+            return {'id': req_id, 'ok': True, 'derivative': dapl, 'stats': stats}
+
+        except Exception as e:
+            return {'id': req_id, 'ok': False, 'error': {'type': type(e).__name__, 'message': str(e)}}
+
+    def handle(self, line: str) -> str:
+        """
+        Handles a line of the protocol.
+
+        Args:
+            line: JSON-encoded request.
+
+        Returns:
+            JSON-encoded response.
+        """
+        try:
+            request = json.loads(line)
+
+        except ValueError as e:
+            response = {'id': None, 'ok': False, 'error': {'type': 'JSONDecodeError', 'message': str(e)}}
+
+        else:
+            response = self.respond(request)
+
+        return json.dumps(response, ensure_ascii=False)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    """
+    Serves the requests of a client connected to the Unix socket.
+    """
+    def handle(self):
+        for line in self.rfile:
+            line = line.decode('utf-8')
+            if line.strip():
+                self.wfile.write((self.server.ada.handle(line)+'\n').encode('utf-8'))
+                self.wfile.flush()
+
+
+def serve_stdio(server: Server) -> None:
+    """
+    Serves requests read from stdin, writing the responses to stdout.
+    """
+    stdin = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    # Anything else printed mustn't be mistaken for responses.
+    sys.stdout = sys.stderr
+
+    for line in stdin:
+        if line.strip():
+            stdout.write(server.handle(line)+'\n')
+            stdout.flush()
+
+
+def serve_socket(server: Server, path: str) -> None:
+    """
+    Serves requests over a Unix socket, each client in its own thread.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+
+    with socketserver.ThreadingUnixStreamServer(path, Handler) as unix_server:
+        unix_server.daemon_threads = True
+        unix_server.ada = server
+        try:
+            unix_server.serve_forever()
+
+        except KeyboardInterrupt:
+            pass
+
+        finally:
+            os.remove(path)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import argparse
+
+    from .transpile import Pyparse
+
+    parser = argparse.ArgumentParser(prog='ada serve',
+                                     description='Differentiates APL dfns on request, \
+                                                  reading JSON lines from stdin or a Unix socket.')
+    parser.add_argument('aplparse',
+                        help='Path to aplparse executable, unless the built-in parser is used.',
+                        type=str,
+                        nargs='?')
+    parser.add_argument('--parser',
+                        help='Parse the dfns with aplparse or the built-in Python parser.',
+                        choices=['aplparse', 'python'],
+                        default='aplparse')
+    parser.add_argument('--socket',
+                        help='Path of the Unix socket to listen on instead of stdin and stdout.',
+                        type=str)
+    parser.add_argument('--no-cache',
+                        help='Neither read from nor write to the derivative cache.',
+                        action='store_true')
+    args = parser.parse_args(argv)
+    if args.parser == 'aplparse' and args.aplparse is None:
+        parser.error('the path to aplparse is required unless --parser python is passed')
+
+    # Everything that can be is loaded up front rather than by the first request.
+    load_prims()
+    cache = None if args.no_cache else DerivativeCache()
+    if cache is not None:
+        load_prim_grads(cache.path / 'prim_grads.json')
+
+    session_cls = Aplparse if args.parser == 'aplparse' else Pyparse
+    with session_cls(args.aplparse) as session:
+        server = Server(session, cache)
+        try:
+            if args.socket is not None:
+                serve_socket(server, args.socket)
+            else:
+                serve_stdio(server)
+
+        finally:
+            if cache is not None:
+                save_prim_grads(cache.path / 'prim_grads.json')
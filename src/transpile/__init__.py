@@ -3,5 +3,6 @@ APL-to-Python & Python-to-APL transpilation.
 """
 
 
-from .apl_to_py import apl_to_py
+from .apl_to_py import Aplparse, apl_to_py
+from .parser import Pyparse
 from .py_to_apl import py_to_apl
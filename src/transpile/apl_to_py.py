@@ -4,16 +4,104 @@ APL-to-Python transpilation.
 
 
 import ast
+import os
 import re
+import shutil
 import subprocess
-import sys
+import tempfile
 from pathlib import Path
-from typing import Dict, List, Union
+from typing import Dict, Iterable, List, Optional, Union
 
-import astor
+from ..profiling import count, stage
 
 
-Node = Dict[str, Union[str, List]]
+class Node:
+    """
+    Node of a parse tree, comprising a name and, unless it's a leaf, children.
+    """
+    __slots__ = ('name', 'children')
+
+    def __init__(self, name: str, children: Optional[List['Node']] = None) -> None:
+        self.name = name
+        self.children = children if children is not None else []
+
+    def __repr__(self) -> str:
+        return f'Node({self.name!r}, {self.children!r})'
+
+
+# Valence information, e.g., [2] or [1,2], which is later reintegrated into the tree via
+# DyTransformer and OpFusionTransformer below, and AutodiffTransformer in src/autodiff.py.
+VALENCE = re.compile(r'\[\d+(,\d+)*\]')
+
+
+def tree_str_to_trees(tree_str: str) -> List[Node]:
+    """
+    Constructs every tree given their concatenated string representations.
+
+    Args:
+        tree_str: String representation of one or more trees.
+
+    Returns:
+        Trees constructed from the string representation, in order.
+    """
+    # Builds the trees in a single left-to-right pass, with an explicit stack of the nodes
+    # whose children are being read, paired with the character closing their children.
+    # Vector literals, i.e., Vec[...], are inlined since strand notation only works
+    # with literals, valence information is discarded, and whitespace in names is collapsed.
+    trees: List[Node] = []
+    stack: List = []
+    name: List[str] = []
+
+    def flush() -> str:
+        flushed = ''.join(name).strip()
+        name.clear()
+        return flushed
+
+    def add(node: Node) -> None:
+        (stack[-1][0].children if stack else trees).append(node)
+
+    idx = 0
+    while idx < len(tree_str):
+        char = tree_str[idx]
+
+        if char == '(':
+            node = Node(flush())
+            add(node)
+            stack.append((node, ')'))
+
+        elif char == '[' and ''.join(name).lstrip() == 'Vec':
+            name.clear()
+            node = Node('Inline')
+            add(node)
+            stack.append((node, ']'))
+
+        elif char == '[':
+            # Valence information is skipped entirely,
+            # and other brackets are merely removed.
+            match = VALENCE.match(tree_str, idx)
+            if match:
+                idx = match.end()-1
+
+        elif char in ',)]':
+            leaf = flush()
+            if leaf:
+                add(Node(leaf))
+            if stack and char == stack[-1][1]:
+                stack.pop()
+
+        elif char.isspace():
+            if name and name[-1] != ' ':
+                name.append(' ')
+
+        else:
+            name.append(char)
+
+        idx += 1
+
+    leaf = flush()
+    if leaf:
+        add(Node(leaf))
+    return trees
 
 
 def tree_str_to_tree(tree_str: str) -> Node:
@@ -26,86 +114,237 @@ def tree_str_to_tree(tree_str: str) -> Node:
     Returns:
         Tree constructed from the string representation.
     """
-    # Builds the tree in a depth-first fashion.
-    # A parser or recursive regex approach could've been used as well.
-    def helper(idx: int) -> Dict[str, Union[str, List]]:
-        start_idx = idx
-        while idx < len(tree_str) and tree_str[idx] not in '(,)':
-            idx += 1
-        name = tree_str[start_idx:idx].strip()
+    return tree_str_to_trees(tree_str)[0]
+
+
+def split_dfns(trees: List[Node]) -> List[Node]:
+    """
+    Extracts the top-level dfn assignments of a parsed program, in order.
+    Whatever nodes aplparse wraps a sequence of statements in are descended into.
+
+    Args:
+        trees: Trees of the parsed program.
+
+    Returns:
+        Assignment nodes of the program's dfns.
+    """
+    dfns, stack = [], list(reversed(trees))
+    while stack:
+        tree = stack.pop()
+        if tree.name == 'Assign':
+            if len(tree.children) == 2 and tree.children[1].name == 'Lam':
+                dfns.append(tree)
+        else:
+            stack.extend(reversed(tree.children))
+    return dfns
+
+
+class Aplparse:
+    """
+    Parsing session around the aplparse executable. Dfns may be parsed in batches,
+    with a single parser launch for the whole batch, and the resulting trees
+    are kept so that a dfn is never handed to the parser twice.
+    The APL source files aplparse expects are written to a private scratch directory
+    instead of the working directory.
 
-        children = []
-        if idx < len(tree_str) and tree_str[idx] == '(':
-            idx += 1
-            while idx < len(tree_str) and tree_str[idx] != ')':
-                child, idx = helper(idx)
-                children.append(child)
-                if idx < len(tree_str) and tree_str[idx] == ',':
-                    idx += 1
-            idx += 1
+    Args:
+        path: Path to aplparse executable.
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.trees: Dict[str, Node] = {}
+        self.launches = 0
+        self.scratch: Optional[str] = None
+
+    def __enter__(self) -> 'Aplparse':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Removes the session's scratch directory.
+        """
+        if self.scratch is not None:
+            shutil.rmtree(self.scratch, ignore_errors=True)
+            self.scratch = None
+
+    def run(self, apl: str) -> str:
+        """
+        Runs aplparse on a piece of APL code.
+
+        Args:
+            apl: APL code to parse.
+
+        Returns:
+            String representation of the parse tree.
+
+        Raises:
+            CalledProcessError: The parser failed to execute.
+        """
+        # The scratch directory is only created once the parser is actually needed.
+        if self.scratch is None:
+            self.scratch = tempfile.mkdtemp(prefix='ada-')
+        path = Path(self.scratch) / 'tmp.apl'
+        path.write_text(apl)
+
+        self.launches += 1
+        count('aplparse_launches')
+        with stage('aplparse'):
+            result = subprocess.run([os.path.join('.', self.path), str(path)],
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE,
+                                    text=True, check=True)
+        return result.stdout.strip()
+
+    def parse(self, apl: str) -> Node:
+        """
+        Parses a dfn, launching aplparse only if the dfn hasn't been parsed before.
+
+        Args:
+            apl: APL dfn to parse.
+
+        Returns:
+            Parse tree of the dfn.
+
+        Raises:
+            CalledProcessError: The parser failed to execute.
+        """
+        if apl not in self.trees:
+            self.trees[apl] = tree_str_to_tree(self.run(apl))
+        return self.trees[apl]
+
+    def parse_many(self, apls: Iterable[str]) -> List[Node]:
+        """
+        Parses several dfns with one aplparse launch by saving them to a single
+        file and splitting the resulting program into its dfns. Should the batch
+        fail to parse or split cleanly, each dfn is parsed on its own instead
+        so that errors are attributed to the right dfn.
+
+        Args:
+            apls: APL dfns to parse.
+
+        Returns:
+            Parse trees of the dfns, in order.
+
+        Raises:
+            CalledProcessError: The parser failed to execute.
+        """
+        apls = list(apls)
+        todo = [apl for apl in dict.fromkeys(apls) if apl not in self.trees]
+
+        if len(todo) > 1:
+            try:
+                trees = split_dfns(tree_str_to_trees(self.run('\n'.join(todo))))
+            except subprocess.CalledProcessError:
+                trees = []
+
+            if len(trees) == len(todo):
+                self.trees.update(zip(todo, trees))
+
+        return [self.parse(apl) for apl in apls]
+
+
+def leaf(name: str) -> ast.expr:
+    """
+    Converts a leaf of the parse tree, i.e., a number or a name, into a Python expression.
 
-        return {'name': name, 'children': children}, idx
+    Args:
+        name: Name of the leaf.
 
-    # Inlines vector literals.
-    # Strand notation only works with literals.
-    tree_str = re.sub(r'Vec\[(.*?)\]', r'Inline(\1)', tree_str)
+    Returns:
+        Python expression equivalent to the leaf.
+    """
+    if name.isidentifier():
+        return ast.Name(id=name, ctx=ast.Load())
 
-    # Removes valence information, which is later reintegrated into the tree via
-    # DyTransformer and OpFusionTransformer below, and AutodiffTransformer
-    # in src/autodiff.py.
-    tree_str = ' '.join(re.sub(r'\[\d+(,\d+)*\]', '', tree_str).split())
-    tree_str = tree_str.replace('[', '').replace(']', '')
+    # Negative numbers carry APL's high minus within strands.
+    if name.startswith(('-', '¯')):
+        return ast.UnaryOp(op=ast.USub(), operand=leaf(name[1:]))
 
-    return helper(0)[0]
+    try:
+        return ast.Constant(value=int(name))
+
+    except ValueError:
+        pass
+
+    try:
+        return ast.Constant(value=float(name.replace('¯', '-')))
+
+    except ValueError:
+        return ast.parse(name, mode='eval').body
 
 
 class Unparse:
     """
-    Unparses apl-tree nodes into Python. Each method is self-explanatory
-    and receives a node's arguments, returning the unparsed Python code.
+    Unparses apl-tree nodes into Python AST. Each method is self-explanatory
+    and receives a node and its unparsed children, returning the unparsed Python AST.
     """
     @staticmethod
-    def node(node: Node) -> str:
-        return (getattr(Unparse, node['name'])(*node['children'])
-                if node['children'] else node['name'])
+    def node(node: Node) -> ast.AST:
+        # Nodes are unparsed in post-order with an explicit stack, so arbitrarily
+        # deep trees don't exceed the recursion limit.
+        unparsed = {}
+        stack = [(node, False)]
+        while stack:
+            cur, visited = stack.pop()
+            if not cur.children:
+                unparsed[id(cur)] = leaf(cur.name)
+
+            elif visited:
+                args = [unparsed.pop(id(child)) for child in cur.children]
+                unparsed[id(cur)] = getattr(Unparse, cur.name)(cur, *args)
+
+            else:
+                stack.append((cur, True))
+                stack.extend((child, False) for child in cur.children)
+
+        return unparsed[id(node)]
+
+    @staticmethod
+    def call(func: ast.expr, *args: ast.expr) -> ast.Call:
+        return ast.Call(func=func, args=list(args), keywords=[])
 
     # This type of node corresponds to Vec from aplparse and
     # inlines its argument as-is when transpiling Python back into APL.
     # It can inline any arbitrary piece of APL code (e.g., dfns) and not merely
     # vectors (see also src/autodiff.py).
     @staticmethod
-    def Inline(*vals) -> str:
-        return f'Inline("{" ".join([val["name"] for val in vals])}")'
+    def Inline(node: Node, *vals) -> ast.Call:
+        return Unparse.call(ast.Name(id='Inline', ctx=ast.Load()),
+                            ast.Constant(value=' '.join(val.name for val in node.children)))
 
     @staticmethod
-    def App1(fun: Node, right: Node) -> str:
-        return f'{Unparse.node(fun)}({Unparse.node(right)})'
+    def App1(node: Node, fun, right) -> ast.Call:
+        return Unparse.call(fun, right)
 
     @staticmethod
-    def App2(fun: Node, left: Node, right: Node) -> str:
-        return f'{Unparse.node(fun)}({Unparse.node(left)}, {Unparse.node(right)})'
+    def App2(node: Node, fun, left, right) -> ast.Call:
+        return Unparse.call(fun, left, right)
 
     @staticmethod
-    def AppOpr1(opr: Node, left: Node) -> str:
-        return f'{opr["name"]}({Unparse.node(left)})'
+    def AppOpr1(node: Node, opr, left) -> ast.Call:
+        return Unparse.call(opr, left)
 
     @staticmethod
-    def AppOpr2(opr: Node, left: Node, right: Node) -> str:
-        return f'{opr["name"]}({Unparse.node(left)}, {Unparse.node(right)})'
+    def AppOpr2(node: Node, opr, left, right) -> ast.Call:
+        return Unparse.call(opr, left, right)
 
     @staticmethod
-    def Assign(var: Node, val: Node) -> str:
-        prefix = (f'def {var["name"]}(Omega):\n' if val['name'] == 'Lam'
-                    else f'{var["name"]} = ' )
-        return f'{prefix}{Unparse.node(val)}'
+    def Assign(node: Node, var, val) -> ast.stmt:
+        if node.children[1].name == 'Lam':
+            func = ast.parse('def _(Omega):\n    pass').body[0]
+            func.name = var.id
+            func.body = val
+            return func
+        return ast.Assign(targets=[ast.Name(id=var.id, ctx=ast.Store())], value=val)
 
     @staticmethod
-    def Lam(*body) -> str:
-        unparsed = []
-        for i, node in enumerate(body):
-            prefix = '    return ' if i == len(body)-1 else '    '
-            unparsed.append(prefix + Unparse.node(node))
-        return '\n'.join(unparsed)
+    def Lam(node: Node, *body) -> List[ast.stmt]:
+        stmts = [stmt if isinstance(stmt, ast.stmt) else ast.Expr(value=stmt)
+                 for stmt in body[:-1]]
+        return stmts + [ast.Return(value=body[-1])]
 
 
 class DyTransformer(ast.NodeTransformer):
@@ -151,44 +390,39 @@ class OpFusionTransformer(ast.NodeTransformer):
         return self.generic_visit(node)
 
 
-def apl_to_py(apl: str, aplparse: str) -> str:
+def apl_to_py(apl: str, aplparse: Union[str, Aplparse]) -> ast.Module:
     """
     Transpiles an APL dfn into a Python function.
 
     Args:
         apl: APL dfn to transpile into Python.
-        aplparse: Path to aplparse executable.
+        aplparse: Path to aplparse executable or a parsing session, which avoids
+            relaunching the parser for dfns it has already parsed. Sessions of the
+            built-in parser don't launch aplparse at all (see src/transpile/parser.py).
 
     Returns:
-        Source code of transpiled Python function.
+        AST of transpiled Python function.
 
     Raises:
         CalledProcessError: The parser failed to execute.
+        SyntaxError: The built-in parser failed to parse the dfn.
     """
-    # aplparse expects an APL source file, so the APL code is
-    # temporarily saved to disk and afterwards deleted.
-    with open(f'tmp.apl', 'w+') as f:
-        f.write(apl)
+    session = aplparse if isinstance(aplparse, Aplparse) else Aplparse(aplparse)
 
     try:
-        result = subprocess.run([f'./{aplparse}', 'tmp.apl'],
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE,
-                                text=True, check=True)
-
-    except subprocess.CalledProcessError as e:
-        print(f'Parsing failed: {e}')
-        sys.exit(1)
+        with stage('parse'):
+            tree = session.parse(apl)
 
     finally:
-        Path('tmp.apl').unlink()
-
-    tree_str = result.stdout.strip()
-    tree = tree_str_to_tree(tree_str)
+        if session is not aplparse:
+            session.close()
 
+    # The tree is unparsed straight into an AST, which is passed along as-is
+    # rather than serialized into source code.
     # Though the two transformers can be merged, they're kept separate for simplicity.
-    py_ast = ast.parse(Unparse.node(tree))
-    py_ast = DyTransformer().visit(py_ast)
-    py_ast = OpFusionTransformer().visit(py_ast)
+    with stage('unparse'):
+        py_ast = ast.Module(body=[Unparse.node(tree)], type_ignores=[])
+        py_ast = DyTransformer().visit(py_ast)
+        py_ast = OpFusionTransformer().visit(py_ast)
 
-    return astor.to_source(py_ast)
+    return ast.fix_missing_locations(py_ast)
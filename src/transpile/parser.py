@@ -0,0 +1,272 @@
+"""
+Built-in APL parser.
+
+Parses the subset of APL dfns that ada supports into the same parse trees
+aplparse produces, after they're read by tree_str_to_trees in
+src/transpile/apl_to_py.py, entirely in-process. That is:
+
+I) Numbers are leaves, with ¯ replaced by -, and strands of numbers are Inline nodes.
+II) Primitives, ⍺, and ⍵ are leaves named by their aplparse identifiers (see
+NAME_TO_GLYPH and OP_TO_GLYPH in src/transpile/py_to_apl.py).
+III) Monadic and dyadic applications of functions are App1 and App2 nodes, and
+those of operators AppOpr1 and AppOpr2 nodes, whose first child is the
+function or operator.
+IV) Assignments are Assign nodes, and dfns are Lam nodes whose children are
+their statements. Parentheses leave no trace.
+"""
+
+
+import re
+from typing import Iterable, List, Optional, Tuple
+
+from .apl_to_py import Aplparse, Node
+from .py_to_apl import NAME_TO_GLYPH, OP_TO_GLYPH
+
+
+# Primitive functions, arguments, and operators, keyed by their glyphs.
+FUNCTIONS = {glyph: name for name, glyph in NAME_TO_GLYPH.items()
+             if glyph and not name.endswith(('Dy', 'Mon')) and
+             name not in OP_TO_GLYPH and name not in ('Alpha', 'Omega')}
+MONADIC_OPS = {'/': 'Slash', '⌿': 'Slashbar', '\\': 'Backslash', '⍀': 'Backslashbar'}
+DYADIC_OPS = {'.': 'Dot', '⍤': 'JotDia'}
+ARGS = {'⍺': 'Alpha', '⍵': 'Omega'}
+
+TOKEN = re.compile(r"""
+    (?P<space>[ \t]+|⍝[^\n]*) |
+    (?P<number>¯?(\d+\.?\d*|\.\d+)([eE]¯?\d+)?) |
+    (?P<name>[A-Za-z_∆⍙][A-Za-z_0-9∆⍙]*) |
+    (?P<sep>[⋄\n]) |
+    (?P<glyph>.)
+    """, re.VERBOSE)
+
+
+def tokenize(apl: str) -> List[Tuple[str, str]]:
+    """
+    Splits APL code into tokens.
+
+    Args:
+        apl: APL code to split.
+
+    Returns:
+        Kinds and text of the tokens, i.e., number, name, sep, or glyph, in order.
+    """
+    tokens = []
+    for match in TOKEN.finditer(apl.replace('\r\n', '\n')):
+        if match.lastgroup != 'space':
+            tokens.append((match.lastgroup, match.group()))
+    return tokens
+
+
+class Parser:
+    """
+    Recursive descent parser of a dfn's tokens. Expressions are read as a
+    sequence of arrays and functions, with operators bound to their operands
+    as they're read, and then evaluated from right to left.
+
+    Args:
+        tokens: Tokens of the dfn (see tokenize).
+    """
+    def __init__(self, tokens: List[Tuple[str, str]]):
+        self.tokens = tokens
+        self.idx = 0
+
+    def peek(self) -> Tuple[str, str]:
+        return self.tokens[self.idx] if self.idx < len(self.tokens) else ('end', '')
+
+    def next(self) -> Tuple[str, str]:
+        token = self.peek()
+        self.idx += 1
+        return token
+
+    def expect(self, text: str) -> None:
+        if self.next()[1] != text:
+            raise SyntaxError(f'Expected {text!r}.')
+
+    def skip_seps(self) -> None:
+        while self.peek()[0] == 'sep':
+            self.idx += 1
+
+    def dfn(self) -> Node:
+        """
+        Parses a named dfn, i.e., name←{...}.
+        """
+        self.skip_seps()
+        kind, name = self.next()
+        if kind != 'name':
+            raise SyntaxError('Expected the name of a dfn.')
+        self.expect('←')
+        self.expect('{')
+
+        stmts = []
+        while True:
+            self.skip_seps()
+            if self.peek()[1] == '}':
+                break
+            stmts.append(self.stmt())
+            if self.peek()[0] != 'sep' and self.peek()[1] != '}':
+                raise SyntaxError(f'Unexpected {self.peek()[1]!r}.')
+        self.expect('}')
+        self.skip_seps()
+
+        if self.peek()[0] != 'end':
+            raise SyntaxError('Expected a single dfn.')
+        if not stmts:
+            raise SyntaxError('Dfns must not be empty.')
+        return Node('Assign', [Node(name), Node('Lam', stmts)])
+
+    def stmt(self) -> Node:
+        """
+        Parses a statement, i.e., an assignment or an expression.
+        """
+        kind, name = self.peek()
+        if kind == 'name' and self.idx+1 < len(self.tokens) and self.tokens[self.idx+1][1] == '←':
+            self.idx += 2
+            return Node('Assign', [Node(name), self.array()])
+        return self.array()
+
+    def array(self) -> Node:
+        """
+        Parses an expression whose value is an array.
+        """
+        is_func, node = self.expr()
+        if is_func:
+            raise SyntaxError('Expected an array, not a function.')
+        return node
+
+    def expr(self) -> Tuple[bool, Node]:
+        """
+        Parses an expression up to a closing parenthesis, brace, or separator.
+
+        Returns:
+            Flag for whether the expression is a function, and its parse tree.
+        """
+        items: List[Tuple[bool, Node]] = []
+        while self.peek()[0] != 'end' and self.peek()[0] != 'sep' and self.peek()[1] not in ')}':
+            kind, text = self.peek()
+            if text in MONADIC_OPS or text in DYADIC_OPS:
+                if not items or not items[-1][0]:
+                    raise SyntaxError(f'{text} must be applied to a function.')
+                self.idx += 1
+                if text in MONADIC_OPS:
+                    items[-1] = True, Node('AppOpr1', [Node(MONADIC_OPS[text]), items[-1][1]])
+                else:
+                    _, right = self.atom()
+                    items[-1] = True, Node('AppOpr2', [Node(DYADIC_OPS[text]), items[-1][1], right])
+            else:
+                items.append(self.atom())
+
+        if not items:
+            raise SyntaxError('Expected an expression.')
+
+        # A lone function, e.g., a derived one in parentheses, is an operand.
+        if len(items) == 1:
+            return items[0]
+
+        is_func, node = items.pop()
+        if is_func:
+            raise SyntaxError('Trains are not supported.')
+        while items:
+            is_func, func = items.pop()
+            if not is_func:
+                raise SyntaxError('Strands of non-literals are not supported.')
+            if items and not items[-1][0]:
+                node = Node('App2', [func, items.pop()[1], node])
+            else:
+                node = Node('App1', [func, node])
+        return False, node
+
+    def atom(self) -> Tuple[bool, Node]:
+        """
+        Parses a primitive, a variable, a strand of numbers, or a parenthesized expression.
+
+        Returns:
+            Flag for whether the atom is a function, and its parse tree.
+        """
+        kind, text = self.next()
+        if kind == 'number':
+            numbers = [Node(text)]
+            while self.peek()[0] == 'number':
+                numbers.append(Node(self.next()[1]))
+            # Strands are inlined as they are, like Vec from aplparse, so only
+            # lone numbers have their high minus turned into a Python one.
+            if len(numbers) == 1:
+                return False, Node(text.replace('¯', '-'))
+            return False, Node('Inline', numbers)
+
+        if kind == 'name':
+            return False, Node(text)
+
+        if text in ARGS:
+            return False, Node(ARGS[text])
+
+        if text in FUNCTIONS:
+            return True, Node(FUNCTIONS[text])
+
+        if text == '(':
+            node = self.expr()
+            self.expect(')')
+            return node
+
+        raise SyntaxError(f'Unsupported token {text!r}.')
+
+
+def parse(apl: str) -> Node:
+    """
+    Parses a named dfn.
+
+    Args:
+        apl: APL dfn to parse, e.g., f←{+/⍵×⍵}.
+
+    Returns:
+        Parse tree of the dfn.
+
+    Raises:
+        SyntaxError: The dfn is invalid or uses unsupported syntax.
+    """
+    return Parser(tokenize(apl)).dfn()
+
+
+class Pyparse(Aplparse):
+    """
+    Parsing session around the built-in parser, which can be used wherever an
+    aplparse session can, but parses dfns in-process rather than by launching
+    aplparse.
+
+    Args:
+        path: Ignored, for compatibility with aplparse sessions.
+    """
+    def __init__(self, path: Optional[str] = None) -> None:
+        super().__init__(path)
+
+    def parse(self, apl: str) -> Node:
+        """
+        Parses a dfn, unless it has been parsed before.
+
+        Args:
+            apl: APL dfn to parse.
+
+        Returns:
+            Parse tree of the dfn.
+
+        Raises:
+            SyntaxError: The dfn is invalid or uses unsupported syntax.
+        """
+        if apl not in self.trees:
+            self.trees[apl] = parse(apl)
+        return self.trees[apl]
+
+    def parse_many(self, apls: Iterable[str]) -> List[Node]:
+        """
+        Parses several dfns. Unlike with aplparse, there's nothing to gain from
+        batching, so they're simply parsed one by one.
+
+        Args:
+            apls: APL dfns to parse.
+
+        Returns:
+            Parse trees of the dfns, in order.
+
+        Raises:
+            SyntaxError: A dfn is invalid or uses unsupported syntax.
+        """
+        return [self.parse(apl) for apl in apls]
@@ -6,6 +6,7 @@ Python-to-APL transpilation.
 import ast
 import re
 from itertools import product
+from typing import Union
 
 
 # Besides Inline, these are standard APL tokens and their aplparse identifiers.
@@ -53,6 +54,7 @@ NAME_TO_GLYPH = {
 }
 OP_TO_GLYPH = {
     'Backslash': '\\', # Scan isn't supported for autodiff, but it's used in the derivative of reduce and reduce first.
+    'Backslashbar': '⍀', # Likewise, scan first is used in the derivative of multiplicative reduce first.
     'Dot': '.',
     'JotDia': '⍤',
     'Slash': '/', # Slash as a function, namely, replicate, isn't supported.
@@ -77,6 +79,25 @@ def is_op(call: ast.Call) -> bool:
     return hasattr(call.func, 'id') and call.func.id in OP_TO_GLYPH
 
 
+class EscapeTransformer(ast.NodeTransformer):
+    """
+    Appends a suffix to variables named after operators. Due to a bug in Tangent,
+    variables might be assigned the names of operators, which would otherwise
+    be unparsed into the operators' glyphs.
+    """
+    def visit_Call(self, node):
+        # The called function keeps its name.
+        if not isinstance(node.func, ast.Name):
+            node.func = self.visit(node.func)
+        node.args = [self.visit(arg) for arg in node.args]
+        return node
+
+    def visit_Name(self, node):
+        if node.id in OP_TO_GLYPH:
+            node.id += '_var_name'
+        return node
+
+
 class Unparse:
     """
     Unparses Python AST into APL. Each method is self-explanatory
@@ -97,14 +118,18 @@ class Unparse:
     @staticmethod
     def Assign(assign: ast.Assign) -> str:
         val = Unparse.node(assign.value)
-        if assign.targets[0].id in NAME_TO_GLYPH:
-            raise RuntimeError(f'Variable name {assign.targets[0].id} is illegal.')
+        for target in assign.targets:
+            if target.id in NAME_TO_GLYPH:
+                raise RuntimeError(f'Variable name {target.id} is illegal.')
 
         # If the unparsed value is a tuple, the assignment is selective,
-        # as described in the Call method.
-        return (f'{val[0]} ⋄ {assign.targets[0].id}←{val[1]}'
-                if isinstance(val, tuple) else
-                f'{assign.targets[0].id}←{Unparse.node(assign.value)}')
+        # as described in the Call method. Assigning the modified variable
+        # to itself is superfluous.
+        if isinstance(val, tuple):
+            return (val[0] if val[1] == assign.targets[0].id else
+                    f'{val[0]} ⋄ {assign.targets[0].id}←{val[1]}')
+        # Multiple targets are assigned the same value, as in a←b←⍬.
+        return ''.join(f'{target.id}←' for target in assign.targets) + val
 
     @staticmethod
     def Call(call: ast.Call) -> str:
@@ -140,7 +165,7 @@ class Unparse:
 
     @staticmethod
     def Constant(const: ast.Constant) -> str:
-        return const.value
+        return str(const.value)
 
     @staticmethod
     def Name(name: ast.Name) -> str:
@@ -151,6 +176,11 @@ class Unparse:
     def Return(ret: ast.Return) -> str:
         return Unparse.node(ret.value)
 
+    @staticmethod
+    def Tuple(tup: ast.Tuple) -> str:
+        # Tuples are returned as strands of their elements.
+        return ' '.join(f'({Unparse.node(elt)})' for elt in tup.elts)
+
     @staticmethod
     def UnaryOp(uop: ast.UnaryOp):
         if not isinstance(uop.op, ast.USub):
@@ -158,20 +188,21 @@ class Unparse:
         return f'¯{Unparse.node(uop.operand)}'
 
 
-def py_to_apl(py: str) -> str:
+def py_to_apl(py: Union[str, ast.AST]) -> str:
     """
     Transpiles a Python function into an APL dfn.
 
     Args:
-        py: Python function to transpile into APL.
+        py: Python function to transpile into APL, as source code, a module,
+            or a function definition.
 
     Returns:
         Source code of the transpiled APL dfn.
     """
-    # Due to a bug in Tangent, variables might be assigned the names of operators.
-    # This regex appends a suffix to them to avoid conflicts.
-    for op in OP_TO_GLYPH:
-        py = re.sub(rf'\b{op}\b(?!\()', rf'{op}_var_name', py)
+    if isinstance(py, str):
+        py = ast.parse(py)
+    if isinstance(py, ast.Module):
+        py = py.body[0]
 
-    apl = Unparse.node(ast.parse(py).body[0])
+    apl = Unparse.node(EscapeTransformer().visit(py))
     return re.sub(r'\(([a-zA-Z0-9_⍺⍵¯]+)\)', r'\1', apl) # Strips redundant parentheses away.
@@ -0,0 +1,53 @@
+"""
+Checks that the built-in parser (see src/transpile/parser.py) produces the
+same parse trees as aplparse for every dfn in tests/prims.aplf, or in the
+APL files passed, plus the literals in LITERALS.
+
+Usage:
+    python -m tests.parser_equivalence <aplparse> [apl ...]
+"""
+
+
+import re
+import sys
+
+from src.transpile import Aplparse, Pyparse
+
+
+# Dfns with literals, e.g., negative numbers in strands, which the primitives don't cover.
+LITERALS = [
+    'neg←{¯2×⍵}',
+    'neg_strand←{1 ¯2×⍵}',
+    'neg_float_strand←{¯1.5 2E¯3+⍵}',
+    ]
+
+
+def main() -> None:
+    apls = []
+    for path in sys.argv[2:] or ['tests/prims.aplf']:
+        with open(path, 'r') as f:
+            apls.extend(re.findall(r'\b\w+←\{[^{}]*\}', f.read()))
+    apls.extend(LITERALS)
+
+    with Aplparse(sys.argv[1]) as session, Pyparse() as pysession:
+        trees = session.parse_many(apls)
+        mismatches = 0
+        for apl, tree in zip(apls, trees):
+            try:
+                pytree = pysession.parse(apl)
+
+            except SyntaxError as e:
+                pytree = e
+
+            if repr(pytree) != repr(tree):
+                mismatches += 1
+                print(f'Mismatch for {apl.split("←")[0]}:\n'
+                      f'    aplparse: {tree!r}\n'
+                      f'    built-in: {pytree!r}')
+
+    print(f'{len(apls)-mismatches}/{len(apls)} dfns parsed identically.')
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Tests of the options of autodiff on small dfns, parsed by the built-in parser.
+Their numerical correctness is checked by the Dyalog tests instead (see the README).
+
+Usage:
+    python -m pytest tests/test_autodiff.py
+"""
+
+
+import ast
+import re
+import textwrap
+import unittest
+
+import astor
+
+from src.autodiff import autodiff, preserve_result
+from src.transpile import Pyparse
+
+
+def differentiate(apl: str, **options) -> str:
+    return autodiff(apl, Pyparse(), **options)
+
+
+def lines(dapl: str) -> list:
+    """
+    Returns the statements of a derivative, without its header and closing brace.
+    """
+    return [line.strip() for line in dapl.strip().splitlines()[1:-1]]
+
+
+class TestValueAndGrad(unittest.TestCase):
+    APL = 'g←{a←1○⍵ ⋄ a×⍵}'
+
+    def test_output_returned_first(self):
+        dapl = differentiate(self.APL, value_and_grad=True)
+        self.assertEqual(lines(dapl)[-1], 'result bOmega')
+
+    def test_gradient_unchanged(self):
+        # The output is kept alongside the gradient, which is computed as usual.
+        grad = lines(differentiate(self.APL))
+        value_and_grad = lines(differentiate(self.APL, value_and_grad=True))
+        self.assertLessEqual(set(grad[:-1]), set(value_and_grad))
+
+    def test_forward_pass_shared(self):
+        dapl = differentiate(self.APL, value_and_grad=True)
+        self.assertEqual(dapl.count('1○⍵'), 1)
+
+    def test_unsupported_modes(self):
+        for mode in ['forward', 'hvp']:
+            with self.assertRaises(ValueError):
+                differentiate(self.APL, value_and_grad=True, mode=mode)
+
+    def test_preserve_result(self):
+        dpy = ast.parse(textwrap.dedent("""
+            def dgdOmega(Omega, bz):
+                bOmega = TimesDy(bz, Omega)
+                return bOmega, z
+            """))
+        self.assertEqual(astor.to_source(preserve_result(dpy)).strip().splitlines()[-1],
+                         '    return z, bOmega')
+
+        dpy = ast.parse(textwrap.dedent("""
+            def dgdOmega(Omega, bz):
+                return TimesDy(bz, Omega)
+            """))
+        with self.assertRaises(RuntimeError):
+            preserve_result(dpy)
+
+
+class TestWrt(unittest.TestCase):
+    APL = 'f←{x←1⊃⍵ ⋄ w←2⊃⍵ ⋄ +/x×1○w}'
+
+    def test_first_item(self):
+        # The gradient of w, which needs its cosine, isn't computed.
+        dapl = differentiate(self.APL, wrt=[1])
+        self.assertIn('(1⊃bOmega)←', dapl)
+        self.assertNotIn('2⊃zeros', dapl)
+        self.assertNotIn('2○w', dapl)
+
+    def test_second_item(self):
+        dapl = differentiate(self.APL, wrt=[2])
+        self.assertIn('(2⊃zeros)←', dapl)
+        self.assertNotIn('1⊃bOmega', dapl)
+        self.assertNotIn('bx', dapl)
+
+    def test_every_item(self):
+        self.assertEqual(differentiate(self.APL, wrt=[1, 2]), differentiate(self.APL))
+
+    def test_unsupported_modes(self):
+        for mode in ['forward', 'hvp']:
+            with self.assertRaises(ValueError):
+                differentiate(self.APL, wrt=[1], mode=mode)
+
+
+class TestForward(unittest.TestCase):
+    def test_tangent(self):
+        dapl = differentiate('f←{1○⍵}', mode='forward')
+        self.assertEqual(dapl.splitlines()[0], 'dfdOmega←{')
+        self.assertEqual(lines(dapl), ['dCircDy_1_Omega←⍺×2○⍵', 'dCircDy_1_Omega'])
+
+    def test_product_rule(self):
+        self.assertIn('(⍺×⍵)+⍵×⍺', differentiate('f←{+/⍵×⍵}', mode='forward'))
+
+    def test_linear(self):
+        self.assertIn('⍉⍺', differentiate('f←{⍉⍵}', mode='forward'))
+
+    def test_nested_argument(self):
+        # The tangent is nested like the argument.
+        dapl = differentiate('f←{(1⊃⍵)×2⊃⍵}', mode='forward')
+        self.assertIn('1⊃⍺', dapl)
+        self.assertIn('2⊃⍺', dapl)
+
+    def test_no_backward_pass(self):
+        # Adjoints, whose names start with b, and the reverse mode's
+        # reshaping of the output's derivative are absent.
+        dapl = differentiate('f←{+/(1○⍵)×⍵*2}', mode='forward')
+        self.assertFalse(any(re.match(r'_?b', line) for line in lines(dapl)))
+        self.assertNotIn('⍴⍺', dapl)
+
+    def test_prims(self):
+        # Every primitive has a tangent, which is zero if it isn't differentiable.
+        with open('tests/prims.aplf', 'r') as f:
+            apls = re.findall(r'\b\w+←\{[^{}]*\}', f.read())
+        for apl in apls:
+            name = apl.split('←')[0]
+            with self.subTest(name):
+                dapl = differentiate(apl, mode='forward')
+                self.assertTrue(dapl.startswith(f'd{name}dOmega←{{'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+"""
+Tests of gradient checkpointing (see src/checkpoint.py) on small hand-written
+Python derivatives.
+
+Usage:
+    python -m pytest tests/test_checkpoint.py
+"""
+
+
+import ast
+import textwrap
+import unittest
+
+import astor
+
+from src.checkpoint import rematerialize
+
+
+def parse(src: str) -> ast.Module:
+    return ast.parse(textwrap.dedent(src))
+
+
+def unparse(py: ast.AST) -> str:
+    return astor.to_source(py).strip()
+
+
+# Derivative of {Exp Exp Exp ⍵}, whose forward pass is followed by the
+# backward pass, starting with the first read of the output's derivative bout.
+CHAIN = """
+    def f(Omega, bout):
+        a = Exp(Omega)
+        b = Exp(a)
+        c = Exp(b)
+        bc = TimesDy(bout, c)
+        bb = TimesDy(bc, b)
+        ba = TimesDy(bb, a)
+        return ba
+    """
+
+
+class TestRematerialize(unittest.TestCase):
+    def assertRematerialized(self, src: str, dst: str, checkpoints=True):
+        self.assertEqual(unparse(rematerialize(parse(src), checkpoints)), unparse(parse(dst)))
+
+    def test_checkpoints(self):
+        # a is released once b is computed, c is left to the backward pass,
+        # and both are recomputed right before they're first read.
+        self.assertRematerialized(CHAIN, """
+            def f(Omega, bout):
+                a = Exp(Omega)
+                b = Exp(a)
+                a = Inline('⍬')
+                c = Exp(b)
+                bc = TimesDy(bout, c)
+                bb = TimesDy(bc, b)
+                a = Exp(Omega)
+                ba = TimesDy(bb, a)
+                return ba
+            """, ['b'])
+
+    def test_dependencies_recomputed(self):
+        # b is recomputed from a, which is recomputed first.
+        self.assertRematerialized(CHAIN, """
+            def f(Omega, bout):
+                a = Exp(Omega)
+                b = Exp(a)
+                a = Inline('⍬')
+                c = Exp(b)
+                b = Inline('⍬')
+                bc = TimesDy(bout, c)
+                a = Exp(Omega)
+                b = Exp(a)
+                bb = TimesDy(bc, b)
+                ba = TimesDy(bb, a)
+                return ba
+            """, ['c'])
+
+    def test_unneeded_intermediates_deferred(self):
+        # Neither b nor c is needed by the rest of the forward pass, so they're
+        # only computed once the backward pass needs them.
+        self.assertRematerialized("""
+            def f(Omega, bout):
+                a = Exp(Omega)
+                b = Exp(a)
+                c = Exp(b)
+                z = Sub(a)
+                bc = TimesDy(bout, c)
+                bb = TimesDy(bc, b)
+                ba = TimesDy(bb, a)
+                return ba
+            """, """
+            def f(Omega, bout):
+                a = Exp(Omega)
+                z = Sub(a)
+                b = Exp(a)
+                c = Exp(b)
+                bc = TimesDy(bout, c)
+                bb = TimesDy(bc, b)
+                ba = TimesDy(bb, a)
+                return ba
+            """, ['a', 'z'])
+
+    def test_default_checkpoints(self):
+        # With 3 statements in the forward pass, every 2nd one is a checkpoint.
+        self.assertRematerialized(CHAIN, """
+            def f(Omega, bout):
+                a = Exp(Omega)
+                b = Exp(a)
+                a = Inline('⍬')
+                c = Exp(b)
+                bc = TimesDy(bout, c)
+                bb = TimesDy(bc, b)
+                a = Exp(Omega)
+                ba = TimesDy(bb, a)
+                return ba
+            """)
+
+    def test_reassigned_kept(self):
+        # x is assigned twice, so neither it nor y, which depends on it, is recomputed.
+        src = """
+            def f(Omega, bout):
+                x = Exp(Omega)
+                x = Exp(x)
+                y = Exp(x)
+                by = TimesDy(bout, y)
+                bx = TimesDy(by, x)
+                return bx
+            """
+        self.assertRematerialized(src, src, [])
+
+    def test_inline_reads(self):
+        # a is only read by inlined code in the backward pass.
+        self.assertRematerialized("""
+            def f(Omega, bout):
+                a = Exp(Omega)
+                b = Exp(a)
+                bb = TimesDy(bout, b)
+                ba = Inline('{⍵×a}')(bb)
+                return ba
+            """, """
+            def f(Omega, bout):
+                a = Exp(Omega)
+                b = Exp(a)
+                a = Inline('⍬')
+                bb = TimesDy(bout, b)
+                a = Exp(Omega)
+                ba = Inline('{⍵×a}')(bb)
+                return ba
+            """, ['b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,420 @@
+"""
+Tests of the optimizations in src/optimize.py on small hand-written Python
+functions of APL primitives.
+
+Usage:
+    python -m pytest tests/test_optimize.py
+"""
+
+
+import ast
+import textwrap
+import unittest
+
+import astor
+
+from src.optimize import cse, dce, prune_inactive, release_dead
+
+
+def parse(src: str) -> ast.Module:
+    return ast.parse(textwrap.dedent(src))
+
+
+def unparse(py: ast.AST) -> str:
+    return astor.to_source(py).strip()
+
+
+def expected(src: str) -> str:
+    return unparse(parse(src))
+
+
+class TestCSE(unittest.TestCase):
+    def assertCSE(self, src: str, dst: str):
+        self.assertEqual(unparse(cse(parse(src))), expected(dst))
+
+    def test_repeated_call_bound_once(self):
+        self.assertCSE("""
+            def f(Omega):
+                a = TimesDy(Rho(Omega), 2)
+                b = AddDy(Rho(Omega), 1)
+                c = CatDy(a, Rho(Omega))
+                return AddDy(b, c)
+            """, """
+            def f(Omega):
+                _cse0 = Rho(Omega)
+                a = TimesDy(_cse0, 2)
+                b = AddDy(_cse0, 1)
+                c = CatDy(a, _cse0)
+                return AddDy(b, c)
+            """)
+
+    def test_assignment_reused(self):
+        self.assertCSE("""
+            def f(Omega):
+                a = Exp(Omega)
+                b = Exp(Omega)
+                return AddDy(a, b)
+            """, """
+            def f(Omega):
+                a = Exp(Omega)
+                b = a
+                return AddDy(a, b)
+            """)
+
+    def test_reassigned_operand(self):
+        src = """
+            def f(Omega):
+                x = Exp(Omega)
+                a = Exp(x)
+                x = Exp(a)
+                b = Exp(x)
+                return AddDy(a, b)
+            """
+        self.assertCSE(src, src)
+
+    def test_reassigned_variable(self):
+        # a no longer holds Exp(Omega) by the time it's recomputed.
+        src = """
+            def f(Omega):
+                a = Exp(Omega)
+                a = TimesDy(a, 2)
+                b = Exp(Omega)
+                return AddDy(a, b)
+            """
+        self.assertCSE(src, src)
+
+    def test_selective_assignment(self):
+        # Assigning into x selectively modifies it, even under another name.
+        src = """
+            def f(Omega):
+                x = Exp(Omega)
+                a = Exp(x)
+                y = SelectiveAssign(DiscloseDy(1, x), 0, x)
+                b = Exp(x)
+                return AddDy(a, AddDy(b, y))
+            """
+        self.assertCSE(src, src)
+
+
+class TestDCE(unittest.TestCase):
+    def assertDCE(self, src: str, dst: str):
+        self.assertEqual(unparse(dce(parse(src))), expected(dst))
+
+    def test_addition_of_zero(self):
+        self.assertDCE("""
+            def f(Omega):
+                z = TimesDy(0, Omega)
+                g = Exp(Omega)
+                a = AddDy(z, g)
+                return a
+            """, """
+            def f(Omega):
+                g = Exp(Omega)
+                a = g
+                return a
+            """)
+
+    def test_product_with_zero_of_same_shape(self):
+        self.assertDCE("""
+            def f(Omega):
+                z = TimesDy(0, Omega)
+                z2 = TimesDy(0, Omega)
+                a = TimesDy(z, Omega)
+                b = TimesDy(2, z2)
+                c = TimesDy(a, z2)
+                return AddDy(b, c)
+            """, """
+            def f(Omega):
+                z = TimesDy(0, Omega)
+                z2 = TimesDy(0, Omega)
+                a = z
+                b = z2
+                c = a
+                return AddDy(b, c)
+            """)
+
+    def test_product_with_zero_of_other_shape(self):
+        # x might be larger than z under scalar extension, or smaller, so the
+        # product is kept to have the right shape.
+        src = """
+            def f(Omega):
+                s = Exp(Omega)
+                x = Exp(Omega)
+                z = TimesDy(0, s)
+                a = TimesDy(z, x)
+                return a
+            """
+        self.assertDCE(src, src)
+
+    def test_reassigned_shape(self):
+        # z is shaped like Omega's value before its reassignment only.
+        self.assertDCE("""
+            def f(Omega):
+                z = TimesDy(0, Omega)
+                Omega = Exp(Omega)
+                a = TimesDy(z, Omega)
+                return a
+            """, """
+            def f(Omega):
+                z = TimesDy(0, Omega)
+                Omega = Exp(Omega)
+                a = TimesDy(z, Omega)
+                return a
+            """)
+
+    def test_selective_assignment_of_zero(self):
+        self.assertDCE("""
+            def f(Omega):
+                z = TimesDy(0, Omega)
+                t = TimesDy(0, Omega)
+                z = SelectiveAssign(DiscloseDy(1, z), t, z)
+                return z
+            """, """
+            def f(Omega):
+                z = TimesDy(0, Omega)
+                return z
+            """)
+
+    def test_selective_assignment_of_nonzero(self):
+        # z no longer is zero once a nonzero value is assigned into it.
+        self.assertDCE("""
+            def f(Omega):
+                z = TimesDy(0, Omega)
+                g = Exp(Omega)
+                z = SelectiveAssign(DiscloseDy(1, z), g, z)
+                a = AddDy(z, g)
+                return a
+            """, """
+            def f(Omega):
+                z = TimesDy(0, Omega)
+                g = Exp(Omega)
+                z = SelectiveAssign(DiscloseDy(1, z), g, z)
+                a = AddDy(z, g)
+                return a
+            """)
+
+    def test_dead_code(self):
+        # Names read by inlined code keep their assignments alive.
+        self.assertDCE("""
+            def f(Omega):
+                a = Exp(Omega)
+                b = Exp(a)
+                c = Exp(Omega)
+                d = Inline('{⍵×c}')(Omega)
+                return d
+            """, """
+            def f(Omega):
+                c = Exp(Omega)
+                d = Inline('{⍵×c}')(Omega)
+                return d
+            """)
+
+
+class TestPruneInactive(unittest.TestCase):
+    # Gradient of {(1⊃⍵)×2⊃⍵} as it's assembled after fuse_selections.
+    GRAD = """
+        def dfdOmega(Omega, bz):
+            x = DiscloseDy(1, Omega)
+            w = DiscloseDy(2, Omega)
+            bx = TimesDy(bz, w)
+            bw = TimesDy(bz, x)
+            zeros = TimesDy(0, Omega)
+            bOmega = SelectiveAssign(DiscloseDy(1, zeros), bx, zeros)
+            bOmega = SelectiveAssign(DiscloseDy(2, bOmega), AddDy(DiscloseDy(2, bOmega), bw), bOmega)
+            return bOmega
+        """
+
+    def assertPruned(self, src: str, dst: str, wrt):
+        self.assertEqual(unparse(prune_inactive(parse(src), wrt)), expected(dst))
+
+    def test_first_item(self):
+        self.assertPruned(self.GRAD, """
+            def dfdOmega(Omega, bz):
+                w = DiscloseDy(2, Omega)
+                bx = TimesDy(bz, w)
+                zeros = TimesDy(0, Omega)
+                bOmega = SelectiveAssign(DiscloseDy(1, zeros), bx, zeros)
+                return bOmega
+            """, [1])
+
+    def test_second_item(self):
+        self.assertPruned(self.GRAD, """
+            def dfdOmega(Omega, bz):
+                x = DiscloseDy(1, Omega)
+                bw = TimesDy(bz, x)
+                zeros = TimesDy(0, Omega)
+                bOmega = zeros
+                bOmega = SelectiveAssign(DiscloseDy(2, bOmega), AddDy(DiscloseDy(2, bOmega), bw), bOmega)
+                return bOmega
+            """, [2])
+
+    def test_every_item(self):
+        self.assertPruned(self.GRAD, self.GRAD, [1, 2])
+
+    def test_other_arrays_kept(self):
+        # Only assignments into gradients of the argument are pruned.
+        src = """
+            def dfdOmega(Omega, bz):
+                t = Exp(Omega)
+                t = SelectiveAssign(DiscloseDy(2, t), bz, t)
+                return t
+            """
+        self.assertPruned(src, src, [1])
+
+
+class TestReleaseDead(unittest.TestCase):
+    def release(self, src: str):
+        stats = {}
+        py = release_dead(parse(src), stats)
+        return unparse(py), stats['peak_live']
+
+    def test_release_after_last_use(self):
+        dpy, _ = self.release("""
+            def f(Omega):
+                a = Exp(Omega)
+                b = Exp(a)
+                c = Exp(b)
+                return c
+            """)
+        self.assertEqual(dpy, expected("""
+            def f(Omega):
+                a = Exp(Omega)
+                b = Exp(a)
+                a = Inline('⍬')
+                c = Exp(b)
+                b = Inline('⍬')
+                return c
+            """))
+
+    def test_copy_chain(self):
+        # The copies share a's memory, so it's released with the last of them.
+        dpy, _ = self.release("""
+            def f(Omega):
+                a = Exp(Omega)
+                b = a
+                c = b
+                d = TimesDy(c, c)
+                return d
+            """)
+        self.assertEqual(dpy, expected("""
+            def f(Omega):
+                a = Exp(Omega)
+                b = a
+                c = b
+                d = TimesDy(c, c)
+                c = b = a = Inline('⍬')
+                return d
+            """))
+
+    def test_selective_assign_into_copy(self):
+        # Releasing the source first spares the copy on write.
+        dpy, _ = self.release("""
+            def f(Omega):
+                a = Exp(Omega)
+                b = a
+                b = SelectiveAssign(DiscloseDy(1, b), 0, b)
+                c = TimesDy(a, b)
+                return c
+            """)
+        self.assertEqual(dpy, expected("""
+            def f(Omega):
+                a = Exp(Omega)
+                b = a
+                b = SelectiveAssign(DiscloseDy(1, b), 0, b)
+                c = TimesDy(a, b)
+                a = b = Inline('⍬')
+                return c
+            """))
+
+        dpy, _ = self.release("""
+            def f(Omega):
+                a = Exp(Omega)
+                b = a
+                b = SelectiveAssign(DiscloseDy(1, b), 0, b)
+                return b
+            """)
+        self.assertEqual(dpy, expected("""
+            def f(Omega):
+                a = Exp(Omega)
+                b = a
+                a = Inline('⍬')
+                b = SelectiveAssign(DiscloseDy(1, b), 0, b)
+                return b
+            """))
+
+    def test_inline_reads(self):
+        # t is local to the inlined dfn, whereas a is read by it.
+        dpy, _ = self.release("""
+            def f(Omega):
+                a = Exp(Omega)
+                t = Exp(Omega)
+                b = Inline('{t←⍵×2 ⋄ t×a}')(Omega)
+                c = TimesDy(b, t)
+                return c
+            """)
+        self.assertEqual(dpy, expected("""
+            def f(Omega):
+                a = Exp(Omega)
+                t = Exp(Omega)
+                b = Inline('{t←⍵×2 ⋄ t×a}')(Omega)
+                a = Inline('⍬')
+                c = TimesDy(b, t)
+                b = t = Inline('⍬')
+                return c
+            """))
+
+    def test_called_functions_are_not_reads(self):
+        dpy, _ = self.release("""
+            def f(Omega):
+                DotDyDy = DotDyDy(Add, Times, Omega, Omega)
+                b = Exp(DotDyDy)
+                c = DotDyDy(Add, Times, b, b)
+                return c
+            """)
+        self.assertEqual(dpy, expected("""
+            def f(Omega):
+                DotDyDy = DotDyDy(Add, Times, Omega, Omega)
+                b = Exp(DotDyDy)
+                DotDyDy = Inline('⍬')
+                c = DotDyDy(Add, Times, b, b)
+                b = Inline('⍬')
+                return c
+            """))
+
+    def test_small_arrays_are_kept(self):
+        dpy, _ = self.release("""
+            def f(Omega):
+                n = Nmatch(Rho(Omega))
+                a = RhoDy(n, Omega)
+                return a
+            """)
+        self.assertEqual(dpy, expected("""
+            def f(Omega):
+                n = Nmatch(Rho(Omega))
+                a = RhoDy(n, Omega)
+                return a
+            """))
+
+    def test_peak_live(self):
+        _, peak = self.release("""
+            def f(Omega):
+                a = Exp(Omega)
+                b = Exp(a)
+                c = Exp(b)
+                return c
+            """)
+        self.assertEqual(peak, 2)
+
+        _, peak = self.release("""
+            def f(Omega):
+                a = Exp(Omega)
+                b = Exp(Omega)
+                c = AddDy(a, b)
+                d = Exp(c)
+                return d
+            """)
+        self.assertEqual(peak, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()